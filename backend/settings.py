@@ -13,6 +13,7 @@ from pathlib import Path
 
 import dj_database_url
 import environ
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -50,7 +51,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'tournaments.middleware.StaticFilesMiddleware',
+    'tournaments.middleware.QueryMetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -83,11 +85,75 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
 DATABASE_URL = env("DATABASE_URL")
-db_config = dj_database_url.config(default=DATABASE_URL)
+
+# CONN_MAX_AGE keeps a connection open for that many seconds and reuses it across requests (0 closes it
+# after every request). Under ASGI every request runs its queries on a new thread, so a persistent
+# connection is never reused there: set DB_POOL instead, which uses psycopg 3's connection pool on
+# Postgres and needs CONN_MAX_AGE=0. Other engines have no pool, so DB_POOL is ignored for them.
+
+db_config = dj_database_url.config(
+    default=DATABASE_URL,
+    conn_max_age=env.int('CONN_MAX_AGE', default=0),
+    conn_health_checks=env.bool('CONN_HEALTH_CHECKS', default=False),
+)
+if env.bool('DB_POOL', default=False) and db_config['ENGINE'] == 'django.db.backends.postgresql':
+    if db_config['CONN_MAX_AGE']:
+        raise ImproperlyConfigured("DB_POOL can't be combined with persistent connections, set CONN_MAX_AGE=0.")
+    db_config.setdefault('OPTIONS', {})['pool'] = {
+        'min_size': env.int('DB_POOL_MIN_SIZE', default=2),
+        'max_size': env.int('DB_POOL_MAX_SIZE', default=10),
+        'timeout': env.float('DB_POOL_TIMEOUT', default=10.0),
+    }
 DATABASES = {
     'default': db_config,
 }
 
+# The covering indexes only include their extra columns on Postgres; SQLite builds them without.
+SILENCED_SYSTEM_CHECKS = ['models.W040']
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Use a shared backend (e.g. filecache:///var/tmp/hahimur_cache) when running more than one worker,
+# so invalidations reach every process.
+
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
+# Cached pages are keyed by a version that changes on every edit, so the timeout only bounds how
+# long superseded pages take up space.
+
+PAGE_CACHE_TIMEOUT = env.int('PAGE_CACHE_TIMEOUT', default=60 * 60 * 24)
+
+
+# Logging
+# https://docs.djangoproject.com/en/5.1/topics/logging/
+# tournaments.metrics writes one JSON line per request with its query count and timings. By default
+# only the requests that repeat a query (warnings) are logged; REQUEST_METRICS_LEVEL=INFO logs them all.
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'tournaments.metrics': {
+            'handlers': ['console'],
+            'level': env('REQUEST_METRICS_LEVEL', default='WARNING'),
+            'propagate': False,
+        },
+    },
+}
+
+
+# Scoring
+# With ASYNC_SCORING, saving a match queues a ScoringJob instead of rescoring during the request.
+# Run `python manage.py scoring_worker` next to the web process to process the queue.
+
+ASYNC_SCORING = env.bool('ASYNC_SCORING', default=False)
 
 
 # Password validation
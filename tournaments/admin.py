@@ -1,17 +1,94 @@
-from django.contrib import admin
+from django.conf import settings
+from django.contrib import admin, messages
 
-from .models import GroupPrediction, GroupRow, Match, MatchPointRule, PredictionResult, RegisteredTournament, Stage, \
-    StagePoint, \
-    Team, TopScorerPoint, Tournament
+from .models import GroupPrediction, GroupRow, Match, MatchPointRule, PredictionResult, RegisteredTournament, \
+    ScoringJob, Stage, StagePoint, Team, TopScorerPoint, Tournament, enqueue_scoring_jobs, rebuild_total_points, \
+    rescore_stage
 
-admin.site.register(Tournament)
-admin.site.register(Stage)
 admin.site.register(Team)
-admin.site.register(Match)
 admin.site.register(GroupPrediction)
 admin.site.register(StagePoint)
 admin.site.register(TopScorerPoint)
 admin.site.register(PredictionResult)
-admin.site.register(MatchPointRule)
 admin.site.register(RegisteredTournament)
 admin.site.register(GroupRow)
+
+
+@admin.register(ScoringJob)
+class ScoringJobAdmin(admin.ModelAdmin):
+    list_display = ['match', 'status', 'created_at', 'started_at', 'finished_at']
+    list_filter = ['status']
+    list_select_related = ['match__stage__tournament', 'match__home_team', 'match__away_team']
+    readonly_fields = ['match', 'status', 'created_at', 'started_at', 'finished_at', 'error']
+
+
+@admin.register(Match)
+class MatchAdmin(admin.ModelAdmin):
+    # Editing a matchday's scores from the list saves them in one transaction, so the matches are
+    # rescored together once it commits (see tournaments.recompute).
+    list_display = ['__str__', 'start_time', 'home_score', 'away_score']
+    list_editable = ['home_score', 'away_score']
+    list_filter = ['tournament', 'stage']
+    list_select_related = ['stage__tournament', 'home_team', 'away_team']
+
+
+def rescore_stages(modeladmin, request, stages):
+    """Rescore the given stages with their current rules, then rebuild their tournaments' totals.
+
+    With ASYNC_SCORING their matches are queued for the scoring worker instead, like a saved match.
+    Otherwise it runs in the request, one stage after the other.
+    """
+    stages = list(stages)
+    if settings.ASYNC_SCORING:
+        match_ids = list(Match.objects.filter(stage__in=stages).values_list('pk', flat=True))
+        enqueue_scoring_jobs(match_ids)
+        modeladmin.message_user(
+            request,
+            f"Queued {len(match_ids)} match(es) of {len(stages)} stage(s) for the scoring worker.",
+            messages.SUCCESS
+        )
+        return
+    written = sum(rescore_stage(stage.pk) for stage in stages)
+    changed = sum(len(rebuild_total_points(tournament_id)) for tournament_id in {s.tournament_id for s in stages})
+    modeladmin.message_user(
+        request,
+        f"Rescored {len(stages)} stage(s): {written} result(s) and {changed} total(s) changed.",
+        messages.SUCCESS
+    )
+
+
+@admin.register(Tournament)
+class TournamentAdmin(admin.ModelAdmin):
+    actions = ['rescore']
+
+    @admin.action(description="Rescore all predictions with the current rules")
+    def rescore(self, request, queryset):
+        if not settings.ASYNC_SCORING:
+            # A whole tournament is too much for one request, so it's left to the command.
+            ids = " ".join(f"--tournament {pk}" for pk in queryset.values_list('pk', flat=True))
+            self.message_user(
+                request,
+                f"Rescoring whole tournaments needs ASYNC_SCORING. Run: python manage.py rescore {ids}",
+                messages.WARNING
+            )
+            return
+        rescore_stages(self, request, Stage.objects.filter(tournament__in=queryset))
+
+
+@admin.register(Stage)
+class StageAdmin(admin.ModelAdmin):
+    actions = ['rescore']
+    list_filter = ['tournament']
+
+    @admin.action(description="Rescore the stages' predictions with the current rules")
+    def rescore(self, request, queryset):
+        rescore_stages(self, request, queryset)
+
+
+@admin.register(MatchPointRule)
+class MatchPointRuleAdmin(admin.ModelAdmin):
+    actions = ['rescore']
+
+    @admin.action(description="Rescore the rules' stages")
+    def rescore(self, request, queryset):
+        rescore_stages(self, request, Stage.objects.filter(matchpointrule__in=queryset))
@@ -0,0 +1,11 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'api'
+
+urlpatterns = [
+    path("<int:tournament_id>/standings", views.standings, name="standings"),
+    path("<int:tournament_id>/matches", views.matches, name="matches"),
+    path("<int:tournament_id>/matches/<int:match_id>/predictions", views.match_predictions, name="match_predictions"),
+]
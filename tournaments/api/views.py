@@ -0,0 +1,131 @@
+"""Read-only JSON endpoints for the mobile wrapper and the scoreboard screen.
+
+Rows are flat: related objects are referred to by id (plus a display name where a client needs
+one) rather than nested serialize() dicts. Every list endpoint takes ?fields=a,b to return only
+those keys, and only those columns are selected.
+"""
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Value
+from django.db.models.functions import Concat
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import condition, require_GET
+
+from .. import leaderboard
+from ..models import Match, PredictionResult
+from ..pagecache import tournament_etag, tournament_last_modified
+
+STANDINGS_FIELDS = ("friend_id", "name", "points", "rank")
+
+MATCH_FIELDS = {
+    "match_id": "pk",
+    "number": "number",
+    "stage_id": "stage",
+    "start_time": "start_time",
+    "home_team_id": "home_team",
+    "home_team": "home_team__name",
+    "home_score": "home_score",
+    "away_team_id": "away_team",
+    "away_team": "away_team__name",
+    "away_score": "away_score",
+}
+
+PREDICTION_FIELDS = {
+    "friend_id": "prediction__friend",
+    "name": Concat("prediction__friend__first_name", Value(" "), "prediction__friend__last_name"),
+    "home_score": "prediction__home_score",
+    "away_score": "prediction__away_score",
+    "points": "points",
+    "result": "result",
+}
+
+STREAM_CHUNK_SIZE = 500
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+def requested_fields(request, available):
+    """The names listed in ?fields=, in the order of available, or all of them."""
+    fields = request.GET.get("fields")
+    if not fields:
+        return list(available)
+    names = set(fields.split(","))
+    unknown = names.difference(available)
+    if unknown:
+        raise InvalidFields(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return [name for name in available if name in names]
+
+
+def project(queryset, spec, names):
+    """Yield one dict per row with the given names of spec, selecting only their columns."""
+    for row in queryset.values_list(*[spec[name] for name in names]).iterator(chunk_size=STREAM_CHUNK_SIZE):
+        yield dict(zip(names, row))
+
+
+async def aproject(queryset, spec, names):
+    """project(), as an async generator that fetches the rows chunk by chunk in the database thread.
+
+    (QuerySet.aiterator() runs a values_list() query in the event loop in Django 5.1.)
+    """
+    rows = project(queryset, spec, names)
+    next_chunk = sync_to_async(lambda: list(islice(rows, STREAM_CHUNK_SIZE)))
+    while chunk := await next_chunk():
+        for row in chunk:
+            yield row
+
+
+async def stream_json_list(rows):
+    # An async body: under ASGI, Django reads a sync iterator into a list before sending it.
+    yield "["
+    separator = ""
+    async for row in rows:
+        yield separator + json.dumps(row, cls=DjangoJSONEncoder)
+        separator = ","
+    yield "]"
+
+
+def bad_fields(error):
+    return JsonResponse({"error": str(error)}, status=400)
+
+
+@require_GET
+@condition(etag_func=tournament_etag, last_modified_func=tournament_last_modified)
+def standings(request, tournament_id):
+    try:
+        names = requested_fields(request, STANDINGS_FIELDS)
+    except InvalidFields as e:
+        return bad_fields(e)
+    rows = leaderboard.flat_standings(tournament_id)
+    return JsonResponse([{name: row[name] for name in names} for row in rows], safe=False)
+
+
+@require_GET
+@condition(etag_func=tournament_etag, last_modified_func=tournament_last_modified)
+def matches(request, tournament_id):
+    try:
+        names = requested_fields(request, MATCH_FIELDS)
+    except InvalidFields as e:
+        return bad_fields(e)
+    rows = project(Match.objects.filter(tournament=tournament_id), MATCH_FIELDS, names)
+    return JsonResponse(list(rows), safe=False)
+
+
+@require_GET
+@condition(etag_func=tournament_etag, last_modified_func=tournament_last_modified)
+async def match_predictions(request, tournament_id, match_id):
+    """Stream the predictions of a match, best scores first, without building the whole list in memory."""
+    try:
+        names = requested_fields(request, PREDICTION_FIELDS)
+    except InvalidFields as e:
+        return bad_fields(e)
+    queryset = PredictionResult.objects.filter(
+        tournament=tournament_id, prediction__match=match_id
+    ).order_by('-points', 'prediction__friend')
+    return StreamingHttpResponse(stream_json_list(aproject(queryset, PREDICTION_FIELDS, names)),
+                                 content_type="application/json")
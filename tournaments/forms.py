@@ -1,4 +1,5 @@
-from django.forms import ModelForm
+from django.core.exceptions import ValidationError
+from django.forms import BaseModelFormSet, ModelChoiceField, ModelForm
 
 from tournaments.models import GroupPrediction
 
@@ -7,3 +8,34 @@ class PredictionForm(ModelForm):
     class Meta:
         model = GroupPrediction
         fields = ['home_score', 'away_score']
+
+
+class LoadedModelChoiceField(ModelChoiceField):
+    """A ModelChoiceField that looks the submitted pk up in objects that were already loaded.
+
+    The default field runs a query per form to check the hidden id of each row, and accepts the id
+    of any row in the table rather than only the rows the formset was built for.
+    """
+
+    def __init__(self, objects_by_pk, *args, **kwargs):
+        super().__init__(None, *args, **kwargs)
+        self.objects_by_pk = objects_by_pk
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            return self.objects_by_pk[str(value)]
+        except KeyError:
+            raise ValidationError(self.error_messages["invalid_choice"], code="invalid_choice")
+
+
+class BasePredictionFormSet(BaseModelFormSet):
+    def add_fields(self, form, index):
+        super().add_fields(form, index)
+        if not hasattr(self, '_objects_by_pk'):
+            self._objects_by_pk = {str(obj.pk): obj for obj in self.get_queryset()}
+        id_field = form.fields[self._pk_field.name]
+        form.fields[self._pk_field.name] = LoadedModelChoiceField(
+            self._objects_by_pk, initial=id_field.initial, required=False, widget=id_field.widget
+        )
@@ -0,0 +1,63 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import Rank
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import TotalPoint, serialize_friend, total_points_changed
+
+
+def standings_cache_key(tournament_id):
+    return f"tournaments:standings:{tournament_id}"
+
+
+def rank_standings(tournament_id):
+    """Rank the TotalPoint rows of a tournament in one query.
+
+    Friends with equal points share a rank, and the next rank skips the tied places (1, 1, 3).
+    """
+    total_points = TotalPoint.objects.filter(
+        tournament=tournament_id
+    ).select_related('friend').annotate(
+        rank=Window(Rank(), order_by=F('points').desc())
+    ).order_by('-points', '-friend')
+    return [
+        {"friend": serialize_friend(tp.friend), "points": tp.points, "rank": tp.rank}
+        for tp in total_points
+    ]
+
+
+def standings(tournament_id):
+    key = standings_cache_key(tournament_id)
+    ranked = cache.get(key)
+    if ranked is None:
+        ranked = rank_standings(tournament_id)
+        cache.set(key, ranked, None)
+    return ranked
+
+
+def flat_standings(tournament_id):
+    """The cached standings as flat rows (friend_id and name instead of a nested friend)."""
+    return [
+        {"friend_id": row["friend"]["friend_id"], "name": row["friend"]["name"], "points": row["points"],
+         "rank": row["rank"]}
+        for row in standings(tournament_id)
+    ]
+
+
+def invalidate_standings(tournament_id):
+    key = standings_cache_key(tournament_id)
+    cache.delete(key)
+    # A read between now and the commit could cache the old totals again.
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+@receiver(total_points_changed)
+def invalidate_standings_on_total_points_change(sender, tournament_id, **kwargs):
+    invalidate_standings(tournament_id)
+
+
+@receiver([post_save, post_delete], sender=TotalPoint)
+def invalidate_standings_on_total_point_save(sender, instance, **kwargs):
+    invalidate_standings(instance.tournament_id)
@@ -0,0 +1,124 @@
+"""Server-sent events with the standings and match statistics of a tournament.
+
+Each worker process has one Broadcaster. When scoring commits, it computes the standings once,
+diffs them against the last ones it pushed and puts the changed rows on the queue of every client
+connected to that worker. Scoring in another process (the scoring worker, or another web worker)
+is noticed through the results version in the shared cache, which every stream checks while idle.
+"""
+import asyncio
+import json
+import threading
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.dispatch import receiver
+
+from . import leaderboard
+from .models import MATCH_STATS_FIELDS, Match, matches_scored, total_points_changed
+from .pagecache import get_version, results_scope
+
+KEEPALIVE_SECONDS = 15
+QUEUE_SIZE = 100
+
+
+def sse_message(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+def put_dropping_oldest(queue, message):
+    # A client that stopped reading shouldn't make the worker hold every message for it.
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(message)
+
+
+class Broadcaster:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = {}
+        self.last_standings = {}
+
+    def subscribe(self, tournament_id, loop=None):
+        queue = asyncio.Queue(QUEUE_SIZE)
+        loop = loop or asyncio.get_running_loop()
+        with self.lock:
+            self.subscribers.setdefault(tournament_id, set()).add((loop, queue))
+        return queue
+
+    def unsubscribe(self, tournament_id, queue):
+        with self.lock:
+            subscribers = self.subscribers.get(tournament_id, set())
+            subscribers.difference_update({s for s in subscribers if s[1] is queue})
+            if not subscribers:
+                self.subscribers.pop(tournament_id, None)
+                self.last_standings.pop(tournament_id, None)
+
+    def has_subscribers(self, tournament_id):
+        return tournament_id in self.subscribers
+
+    def publish(self, tournament_id, event, data):
+        message = sse_message(event, data)
+        with self.lock:
+            subscribers = list(self.subscribers.get(tournament_id, ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(put_dropping_oldest, queue, message)
+
+    def snapshot(self, tournament_id):
+        """The full standings for a client that just connected."""
+        rows = leaderboard.flat_standings(tournament_id)
+        self.last_standings.setdefault(tournament_id, {row["friend_id"]: row for row in rows})
+        return rows
+
+    def publish_standings(self, tournament_id):
+        """Push the standings rows that changed since the last push, if anyone is listening."""
+        if not self.has_subscribers(tournament_id):
+            return
+        rows = leaderboard.flat_standings(tournament_id)
+        last = self.last_standings.get(tournament_id, {})
+        self.last_standings[tournament_id] = {row["friend_id"]: row for row in rows}
+        changed = [row for row in rows if last.get(row["friend_id"]) != row]
+        if changed:
+            self.publish(tournament_id, "standings", {"full": False, "rows": changed})
+
+    def publish_match_stats(self, tournament_id, match_ids):
+        if not self.has_subscribers(tournament_id):
+            return
+        stats = Match.objects.filter(pk__in=match_ids).values('pk', 'home_score', 'away_score', *MATCH_STATS_FIELDS)
+        for row in stats:
+            row["match_id"] = row.pop("pk")
+            self.publish(tournament_id, "match", row)
+
+
+broadcaster = Broadcaster()
+
+
+async def event_stream(tournament_id):
+    queue = broadcaster.subscribe(tournament_id)
+    version = await sync_to_async(get_version)(results_scope(tournament_id))
+    try:
+        rows = await sync_to_async(broadcaster.snapshot)(tournament_id)
+        yield sse_message("standings", {"full": True, "rows": rows})
+        while True:
+            try:
+                yield await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+            except TimeoutError:
+                current = await sync_to_async(get_version)(results_scope(tournament_id))
+                if current != version:
+                    version = current
+                    await sync_to_async(broadcaster.publish_standings)(tournament_id)
+                yield ": keepalive\n\n"
+    finally:
+        broadcaster.unsubscribe(tournament_id, queue)
+
+
+@receiver(total_points_changed)
+def push_standings(sender, tournament_id, **kwargs):
+    if broadcaster.has_subscribers(tournament_id):
+        transaction.on_commit(lambda: broadcaster.publish_standings(tournament_id))
+
+
+@receiver(matches_scored)
+def push_match_stats(sender, tournament_id, match_ids, **kwargs):
+    if broadcaster.has_subscribers(tournament_id):
+        transaction.on_commit(lambda: broadcaster.publish_match_stats(tournament_id, match_ids))
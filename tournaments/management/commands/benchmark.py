@@ -0,0 +1,124 @@
+import json
+import statistics
+import subprocess
+import time
+import uuid
+from datetime import UTC, datetime
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from tournaments.models import GroupPrediction, Match, RegisteredTournament, Stage, Tournament
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=settings.BASE_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(operation, repeat):
+    """Run operation repeat times and return its median/min wall time and the queries of the last run."""
+    timings, queries = [], 0
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            operation()
+            timings.append(time.perf_counter() - started)
+        queries = len(captured)
+    return {
+        "runs": repeat,
+        "median_ms": round(statistics.median(timings) * 1000, 2),
+        "min_ms": round(min(timings) * 1000, 2),
+        "queries": queries,
+    }
+
+
+class Command(BaseCommand):
+    help = ("Time the match-day hot paths against a seeded tournament (see seed_tournament) and write the timings "
+            "and query counts as JSON. The run registers extra friends and enters scores, so use a throwaway "
+            "tournament.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("tournament", type=int, help="Id of a tournament created by seed_tournament.")
+        parser.add_argument("--repeat", type=int, default=5, help="Runs per operation.")
+        parser.add_argument("--output", help="File to write the JSON results to (default: stdout).")
+
+    def handle(self, *args, tournament, repeat, output, **options):
+        t = Tournament.objects.filter(pk=tournament).first()
+        registration = RegisteredTournament.objects.filter(tournament=t).first()
+        stage = Stage.objects.filter(tournament=t, name__startswith="Group").first()
+        if t is None or registration is None or stage is None:
+            raise CommandError("Needs a tournament with a group stage and a registered friend, see seed_tournament.")
+        friend_id = registration.friend_id
+        match = Match.objects.filter(stage=stage, home_score__isnull=True).first() or \
+            Match.objects.filter(stage=stage).first()
+        client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0])
+        goals = iter(range(10 ** 6))
+
+        def register():
+            with transaction.atomic():
+                friend = User.objects.create(username=f"benchmark-{uuid.uuid4().hex[:12]}")
+                RegisteredTournament.objects.create(friend=friend, tournament=t)
+
+        def save_formset():
+            predictions = list(GroupPrediction.objects.filter(match__stage=stage, friend=friend_id).order_by(
+                'match__stage', 'match__start_time'))
+            data = {
+                "form-TOTAL_FORMS": len(predictions),
+                "form-INITIAL_FORMS": len(predictions),
+            }
+            for i, prediction in enumerate(predictions):
+                data.update({
+                    f"form-{i}-id": prediction.pk,
+                    f"form-{i}-home_score": (prediction.home_score or 0) + 1,
+                    f"form-{i}-away_score": prediction.away_score or 0,
+                })
+            client.post(f"/tournaments/stage/{stage.pk}/friend/{friend_id}/predictions/", data)
+
+        def enter_score():
+            match.home_score, match.away_score = next(goals) % 4, 1
+            with transaction.atomic():
+                match.save()
+
+        def page(url):
+            def get():
+                cache.clear()
+                response = client.get(url)
+                if response.status_code != 200:
+                    raise CommandError(f"{url} returned {response.status_code}")
+            return get
+
+        operations = {
+            "register_friend": register,
+            "save_stage_formset": save_formset,
+            "enter_final_score": enter_score,
+            "standings_page": page(f"/tournaments/{t.pk}/standings"),
+            "match_page": page(f"/tournaments/{t.pk}/matches/{match.pk}"),
+            "friend_page": page(f"/tournaments/{t.pk}/friend/{friend_id}"),
+        }
+        results = {}
+        for name, operation in operations.items():
+            results[name] = measure(operation, repeat)
+            self.stderr.write(f"{name}: {results[name]['median_ms']}ms, {results[name]['queries']} queries")
+
+        report = json.dumps({
+            "timestamp": datetime.now(UTC).isoformat(),
+            "revision": git_revision(),
+            "database": connection.vendor,
+            "tournament": t.pk,
+            "friends": RegisteredTournament.objects.filter(tournament=t).count(),
+            "results": results,
+        }, indent=2)
+        if output:
+            with open(output, "w") as f:
+                f.write(report + "\n")
+        else:
+            self.stdout.write(report)
@@ -0,0 +1,64 @@
+import csv
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tournaments.models import Match, enter_scores
+
+
+def read_rows(path, fmt):
+    with open(path, newline="") as f:
+        if fmt == "json":
+            return json.load(f)
+        return list(csv.DictReader(f))
+
+
+def parse_scores(rows, tournament_id):
+    """Map each row to {match_id: (home_score, away_score)}.
+
+    A row names its match either by match_id, or by stage (name) and number within --tournament.
+    """
+    scores = {}
+    for line, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            raise CommandError(f"Row {line}: expected an object, got {row!r}.")
+        try:
+            if row.get("match_id") not in (None, ""):
+                match_id = int(row["match_id"])
+            else:
+                if tournament_id is None:
+                    raise CommandError("Rows without match_id need --tournament.")
+                match_id = Match.objects.values_list('pk', flat=True).get(
+                    tournament=tournament_id, stage__name=row["stage"], number=int(row["number"])
+                )
+            home_score, away_score = int(row["home_score"]), int(row["away_score"])
+        except (KeyError, TypeError, ValueError, Match.DoesNotExist) as e:
+            raise CommandError(f"Row {line}: {e!r}")
+        if home_score < 0 or away_score < 0:
+            raise CommandError(f"Row {line}: scores can't be negative.")
+        scores[match_id] = (home_score, away_score)
+    return scores
+
+
+class Command(BaseCommand):
+    help = ("Enter the final scores of a matchday from a CSV or JSON file and rescore all of them in one pass. "
+            "Each row has home_score, away_score and either match_id or stage and number.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV file with a header row, or a JSON list of objects.")
+        parser.add_argument("--format", choices=["csv", "json"], help="Defaults to the file extension.")
+        parser.add_argument("--tournament", type=int, help="Tournament of rows that use stage and number.")
+
+    def handle(self, *args, path, format, tournament, **options):
+        fmt = format or ("json" if Path(path).suffix.lower() == ".json" else "csv")
+        scores = parse_scores(read_rows(path, fmt), tournament)
+        if not scores:
+            raise CommandError("No scores in the file.")
+        try:
+            matches = enter_scores(scores)
+        except Match.DoesNotExist as e:
+            raise CommandError(str(e))
+        for match in sorted(matches, key=lambda m: m.start_time):
+            self.stdout.write(f"{match.user_friendly()}")
+        self.stdout.write(self.style.SUCCESS(f"Entered {len(matches)} score(s)."))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Sum
+
+from tournaments.models import GroupPrediction, Match, PredictionResult, RegisteredTournament, StagePoint, \
+    TopScorerPoint, TotalPoint, Tournament
+
+
+class Command(BaseCommand):
+    help = ("Print the query plans of the hot read and scoring queries. "
+            "Run it before and after `migrate` on the same data to compare plans.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tournament", type=int, help="Tournament to plan for (defaults to the first one).")
+        parser.add_argument("--analyze", action="store_true", help="Run the queries (EXPLAIN ANALYZE on Postgres).")
+
+    def handle(self, *args, tournament, analyze, **options):
+        t = Tournament.objects.filter(pk=tournament).first() if tournament else Tournament.objects.first()
+        registration = RegisteredTournament.objects.filter(tournament=t).first()
+        m = Match.objects.filter(tournament=t).first()
+        if t is None or registration is None or m is None:
+            raise CommandError("Needs a tournament with a registered friend and a match.")
+        f = registration.friend_id
+
+        queries = {
+            "match page": PredictionResult.objects.filter(prediction__match=m).for_serialize().order_by(
+                '-points', 'prediction__friend')[:100],
+            "friend page": PredictionResult.objects.filter(tournament=t, prediction__friend=f).for_serialize(),
+            "tofes": GroupPrediction.objects.filter(match__stage=m.stage_id, friend=f).order_by('match__start_time'),
+            "standings": TotalPoint.objects.filter(tournament=t).select_related('friend').order_by('-points'),
+            "scoring": GroupPrediction.objects.filter(match__in=[m.pk]).select_related('predictionresult'),
+            "totals: predictions": PredictionResult.objects.filter(
+                tournament=t, prediction__friend__in=[f]
+            ).values('prediction__friend').annotate(total=Sum('points')).order_by(),
+            "totals: top scorers": TopScorerPoint.objects.filter(
+                match__tournament=t, friend__in=[f]
+            ).values('friend').annotate(total=Sum('points')).order_by(),
+            "totals: stages": StagePoint.objects.filter(
+                stage__tournament=t, friend__in=[f]
+            ).values('friend').annotate(total=Sum('points')).order_by(),
+        }
+        for name, queryset in queries.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(queryset.explain(analyze=True) if analyze else queryset.explain())
+            self.stdout.write("")
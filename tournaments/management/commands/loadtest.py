@@ -0,0 +1,76 @@
+import json
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+
+def fetch(url, timeout):
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        status = None
+    return status, time.perf_counter() - started
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def run_load(urls, requests, concurrency, timeout):
+    """Request the urls round-robin from concurrency threads and summarize the latencies per url."""
+    jobs = [urls[i % len(urls)] for i in range(requests)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(lambda url: (url, *fetch(url, timeout)), jobs))
+    elapsed = time.perf_counter() - started
+
+    summary = {"requests": requests, "concurrency": concurrency, "seconds": round(elapsed, 3),
+               "rps": round(requests / elapsed, 1), "urls": {}}
+    for url in urls:
+        latencies = sorted(seconds for u, status, seconds in results if u == url and status == 200)
+        errors = sum(1 for u, status, _ in results if u == url and status != 200)
+        summary["urls"][url] = {
+            "ok": len(latencies),
+            "errors": errors,
+            "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else None,
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        }
+    return summary
+
+
+class Command(BaseCommand):
+    help = ("Hit running server URLs concurrently and report requests per second and latency percentiles. "
+            "Run it against the WSGI and the ASGI server on the same data to compare them.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("urls", nargs="+", help="Full URLs, requested round-robin.")
+        parser.add_argument("-n", "--requests", type=int, default=1000, help="Total number of requests.")
+        parser.add_argument("-c", "--concurrency", type=int, default=20, help="Requests in flight at once.")
+        parser.add_argument("--timeout", type=float, default=30.0, help="Seconds before a request counts as failed.")
+        parser.add_argument("--json", action="store_true", dest="as_json", help="Print the summary as JSON.")
+
+    def handle(self, *args, urls, requests, concurrency, timeout, as_json, **options):
+        summary = run_load(urls, requests, concurrency, timeout)
+        if as_json:
+            self.stdout.write(json.dumps(summary, indent=2))
+            return
+
+        self.stdout.write(f"{summary['requests']} requests, concurrency {summary['concurrency']}: "
+                          f"{summary['rps']} req/s in {summary['seconds']}s")
+        for url, stats in summary["urls"].items():
+            self.stdout.write(f"  {url}: ok={stats['ok']} errors={stats['errors']} mean={stats['mean_ms']}ms "
+                              f"p50={stats['p50_ms']}ms p95={stats['p95_ms']}ms p99={stats['p99_ms']}ms")
+
@@ -0,0 +1,33 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from tournaments.models import TotalPoint, Tournament, friend_str, rebuild_total_points
+
+
+class Command(BaseCommand):
+    help = "Rebuild TotalPoint from scratch and report the rows that drifted from their points tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument("tournament_ids", nargs="*", type=int, help="Only rebuild these tournaments.")
+
+    def handle(self, *args, tournament_ids, **options):
+        tournaments = Tournament.objects.all()
+        if tournament_ids:
+            tournaments = tournaments.filter(pk__in=tournament_ids)
+
+        drifted = 0
+        for tournament in tournaments:
+            before = dict(TotalPoint.objects.filter(tournament=tournament).values_list('friend', 'points'))
+            changed = rebuild_total_points(tournament.pk)
+            friends = User.objects.only('first_name', 'last_name').in_bulk({tp.friend_id for tp in changed})
+            for total_point in changed:
+                self.stdout.write(
+                    f"{tournament} || {friend_str(friends[total_point.friend_id])} || "
+                    f"{before.get(total_point.friend_id, '-')} -> {total_point.points}"
+                )
+            drifted += len(changed)
+
+        if drifted:
+            self.stdout.write(self.style.WARNING(f"Fixed {drifted} drifted total(s)."))
+        else:
+            self.stdout.write(self.style.SUCCESS("All totals are up to date."))
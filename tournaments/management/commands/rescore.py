@@ -0,0 +1,91 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Q
+
+from tournaments.models import RESCORE_CHUNK_SIZE, Stage, rebuild_total_points, rescore_stage
+
+
+def init_worker():
+    # Make sure a spawned worker has Django set up. A forked one already has it, and opens its own
+    # database connections because the parent closes its connections and pools before starting the pool.
+    django.setup()
+
+
+def close_connections():
+    """Close this process's database connections, and their pools, so forked workers open their own.
+
+    With DB_POOL on, close() only hands a connection back to its psycopg pool, and a forked worker
+    would inherit the pool with its open sockets.
+    """
+    for connection in connections.all():
+        connection.close()
+        if hasattr(connection, "close_pool"):
+            connection.close_pool()
+
+
+def rescore_in_worker(stage_id, chunk_size):
+    try:
+        return rescore_stage(stage_id, chunk_size)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = ("Rescore every prediction of a stage or a whole tournament with the current MatchPointRules, then "
+            "rebuild the totals. Run it after editing a rule. Stages are rescored in parallel, and running it "
+            "again only writes what changed since.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tournament", type=int, action="append", default=[], dest="tournament_ids",
+                            help="Rescore every stage of this tournament (repeatable).")
+        parser.add_argument("--stage", type=int, action="append", default=[], dest="stage_ids",
+                            help="Rescore this stage (repeatable).")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                            help="Processes to rescore stages with (1 rescores them here, one by one).")
+        parser.add_argument("--chunk-size", type=int, default=RESCORE_CHUNK_SIZE,
+                            help="Matches scored and written per transaction.")
+
+    def handle(self, *args, tournament_ids, stage_ids, workers, chunk_size, **options):
+        if not tournament_ids and not stage_ids:
+            raise CommandError("Pass --tournament or --stage.")
+        stages = Stage.objects.filter(Q(tournament__in=tournament_ids) | Q(pk__in=stage_ids))
+        stages = {stage.pk: stage for stage in stages.select_related('tournament').order_by('pk')}
+        missing = set(stage_ids) - stages.keys()
+        if missing:
+            raise CommandError(f"No stage with id {', '.join(map(str, sorted(missing)))}.")
+
+        workers = min(workers, len(stages))
+        if workers > 1:
+            written = self.rescore_in_pool(stages, workers, chunk_size)
+        else:
+            written = self.rescore_here(stages, chunk_size)
+
+        changed = 0
+        for tournament_id in sorted({stage.tournament_id for stage in stages.values()}):
+            changed += len(rebuild_total_points(tournament_id))
+        self.stdout.write(self.style.SUCCESS(
+            f"Rescored {len(stages)} stage(s): {written} result(s) and {changed} total(s) changed."
+        ))
+
+    def rescore_here(self, stages, chunk_size):
+        def progress(stage_id, done, total):
+            self.stdout.write(f"{stages[stage_id]}: {done}/{total} matches")
+
+        return sum(rescore_stage(stage_id, chunk_size, progress) for stage_id in stages)
+
+    def rescore_in_pool(self, stages, workers, chunk_size):
+        written = 0
+        # Forked workers mustn't share the parent's database connections.
+        close_connections()
+        with ProcessPoolExecutor(workers, initializer=init_worker) as pool:
+            futures = {pool.submit(rescore_in_worker, stage_id, chunk_size): stage_id for stage_id in stages}
+            for done, future in enumerate(as_completed(futures), start=1):
+                stage_written = future.result()
+                written += stage_written
+                self.stdout.write(f"[{done}/{len(stages)}] {stages[futures[future]]}: "
+                                  f"{stage_written} result(s) changed")
+        return written
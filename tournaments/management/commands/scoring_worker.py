@@ -0,0 +1,69 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from tournaments.models import Match, ScoringJob, score_matches
+
+
+def claim_jobs(batch_size, stale_after):
+    """Mark up to batch_size waiting jobs as RUNNING and return them.
+
+    Jobs left RUNNING for longer than stale_after seconds belong to a worker that died before
+    finishing them, and are claimed again. Scoring a match twice is harmless.
+    """
+    stale = Q(status=ScoringJob.Status.RUNNING, started_at__lt=timezone.now() - timedelta(seconds=stale_after))
+    with transaction.atomic():
+        jobs = list(ScoringJob.objects.select_for_update(skip_locked=True).filter(
+            Q(status=ScoringJob.Status.PENDING) | stale
+        ).order_by('created_at')[:batch_size])
+        ScoringJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            status=ScoringJob.Status.RUNNING,
+            started_at=timezone.now()
+        )
+    return jobs
+
+
+class Command(BaseCommand):
+    help = "Process queued ScoringJobs: rescore the predictions of each match and rebuild the totals."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=20, help="Jobs to claim and score together.")
+        parser.add_argument("--sleep", type=float, default=2.0, help="Seconds to wait when the queue is empty.")
+        parser.add_argument("--once", action="store_true", help="Exit when the queue is empty.")
+        parser.add_argument("--stale-after", type=float, default=600.0,
+                            help="Seconds after which a RUNNING job is considered abandoned and claimed again.")
+
+    def handle(self, *args, batch_size, sleep, once, stale_after, **options):
+        while True:
+            jobs = claim_jobs(batch_size, stale_after)
+            if not jobs:
+                if once:
+                    return
+                time.sleep(sleep)
+                continue
+            reclaimed = [job.pk for job in jobs if job.status == ScoringJob.Status.RUNNING]
+            if reclaimed:
+                self.stderr.write(self.style.WARNING(f"Reclaimed abandoned jobs {reclaimed}."))
+            self.process(jobs)
+
+    def process(self, jobs):
+        job_ids = [job.pk for job in jobs]
+        try:
+            score_matches(list(Match.objects.filter(pk__in={job.match_id for job in jobs})))
+        except Exception as e:
+            ScoringJob.objects.filter(pk__in=job_ids).update(
+                status=ScoringJob.Status.FAILED,
+                finished_at=timezone.now(),
+                error=repr(e)
+            )
+            self.stderr.write(self.style.ERROR(f"Failed to score jobs {job_ids}: {e!r}"))
+        else:
+            ScoringJob.objects.filter(pk__in=job_ids).update(
+                status=ScoringJob.Status.DONE,
+                finished_at=timezone.now()
+            )
+            self.stdout.write(f"Scored {len(jobs)} job(s).")
@@ -0,0 +1,100 @@
+import random
+from datetime import UTC, datetime, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from tournaments.models import GroupPrediction, Match, MatchPointRule, RegisteredTournament, Stage, Team, \
+    Tournament, rebuild_group_tables, rebuild_total_points, score_matches
+
+GROUPS = "ABCDEF"
+TEAMS_PER_GROUP = 4
+# (stage name, number of matches, wrong, hit, bullseye)
+KNOCKOUT_STAGES = [
+    ("Round of 16", 8, 0, 4, 6),
+    ("Quarter-finals", 4, 0, 5, 7),
+    ("Semi-finals", 2, 0, 6, 8),
+    ("Final", 1, 0, 8, 10),
+]
+
+
+def random_score(rng):
+    return rng.choices(range(5), weights=[30, 35, 20, 10, 5])[0]
+
+
+class Command(BaseCommand):
+    help = ("Create a tournament shaped like the Euro: 24 teams in six groups, 36 group matches and 15 knockout "
+            "matches without teams, scoring rules, and registered friends with random predictions.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--name", default="Benchmark Euro", help="Tournament name (must not exist yet).")
+        parser.add_argument("--friends", type=int, default=100, help="Number of registered friends.")
+        parser.add_argument("--finished", type=int, default=12,
+                            help="Number of group matches that already have a final score.")
+        parser.add_argument("--seed", type=int, default=None, help="Random seed, for repeatable data.")
+
+    def handle(self, *args, name, friends, finished, seed, **options):
+        if Tournament.objects.filter(name=name).exists():
+            raise CommandError(f"Tournament {name!r} already exists.")
+        rng = random.Random(seed)
+        with transaction.atomic():
+            tournament = self.seed(rng, name, friends, finished)
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded tournament {tournament.pk} ({name}): {Match.objects.filter(tournament=tournament).count()} "
+            f"matches, {friends} friends."
+        ))
+
+    def seed(self, rng, name, friend_count, finished_count):
+        tournament = Tournament.objects.create(name=name)
+        kickoff = datetime.now(UTC).replace(hour=16, minute=0, second=0, microsecond=0)
+
+        group_matches = []
+        for group in GROUPS:
+            stage = Stage.objects.create(name=f"Group {group}", tournament=tournament)
+            MatchPointRule.objects.create(stage=stage, wrong=0, hit=3, bullseye=5)
+            # A deleted tournament leaves its teams behind, so seeding the same name again reuses them.
+            teams = [Team.objects.get_or_create(name=f"{name} {group}{i}")[0] for i in range(1, TEAMS_PER_GROUP + 1)]
+            pairs = [(0, 1), (2, 3), (0, 2), (3, 1), (3, 0), (1, 2)]
+            for number, (home, away) in enumerate(pairs, start=1):
+                group_matches.append(Match(stage=stage, tournament=tournament, number=number,
+                                           home_team=teams[home], away_team=teams[away],
+                                           start_time=kickoff + timedelta(hours=3 * len(group_matches))))
+
+        knockout_matches = []
+        start_time = kickoff + timedelta(hours=3 * len(group_matches) + 48)
+        for stage_name, match_count, wrong, hit, bullseye in KNOCKOUT_STAGES:
+            stage = Stage.objects.create(name=stage_name, tournament=tournament)
+            MatchPointRule.objects.create(stage=stage, wrong=wrong, hit=hit, bullseye=bullseye)
+            for number in range(1, match_count + 1):
+                knockout_matches.append(Match(stage=stage, tournament=tournament, number=number,
+                                              start_time=start_time))
+                start_time += timedelta(hours=3)
+
+        # Created in bulk: the per-match receivers would score and create predictions for nobody yet.
+        matches = Match.objects.bulk_create(group_matches + knockout_matches)
+
+        friends = User.objects.bulk_create([
+            User(username=f"{tournament.pk}-friend-{i}", first_name=f"Friend{i}", last_name=name)
+            for i in range(friend_count)
+        ])
+        RegisteredTournament.objects.bulk_create([
+            RegisteredTournament(friend=friend, tournament=tournament) for friend in friends
+        ])
+        GroupPrediction.objects.bulk_create([
+            GroupPrediction(friend=friend, match=match, tournament=tournament,
+                            home_score=random_score(rng) if match.home_team_id else None,
+                            away_score=random_score(rng) if match.home_team_id else None)
+            for friend in friends for match in matches
+        ], batch_size=1000)
+        friend_ids = [friend.pk for friend in friends]
+        for stage_id in {match.stage_id for match in matches}:
+            rebuild_group_tables(stage_id, friend_ids)
+
+        played = sorted(group_matches, key=lambda m: m.start_time)[:finished_count]
+        for match in played:
+            match.home_score, match.away_score = random_score(rng), random_score(rng)
+        Match.objects.bulk_update(played, ['home_score', 'away_score'])
+        score_matches(played)
+        rebuild_total_points(tournament.pk)
+        return tournament
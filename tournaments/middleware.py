@@ -0,0 +1,133 @@
+import json
+import logging
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+logger = logging.getLogger("tournaments.metrics")
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = Counter()
+        self.db_time = 0.0
+        self.render_time = 0.0
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries[sql] += 1
+
+    def duplicates(self):
+        """The SQL statements that ran more than once, which usually means an N+1 loop."""
+        return {sql: count for sql, count in self.queries.most_common() if count > 1}
+
+
+class QueryMetricsMiddleware:
+    """Log the query count, DB time, template render time and wall time of every request.
+
+    One JSON line is written to the tournaments.metrics logger per request, tagged with the URL
+    name (e.g. tournaments:standings). Requests that repeat a statement are logged as warnings.
+    It works both ways, so it doesn't force the async views back into a thread under ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.metrics = metrics = RequestMetrics()
+        started = time.perf_counter()
+        with connection.execute_wrapper(metrics.record_query):
+            response = self.get_response(request)
+        self.log(request, response, metrics, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        request.metrics = metrics = RequestMetrics()
+        started = time.perf_counter()
+        # Connections are per thread, and the async views' queries run in the request's sync thread,
+        # so the wrapper is installed on that thread's connection.
+        def start_recording():
+            recording = connection.execute_wrapper(metrics.record_query)
+            recording.__enter__()
+            return recording
+
+        recording = await sync_to_async(start_recording)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(recording.__exit__)(None, None, None)
+        self.log(request, response, metrics, time.perf_counter() - started)
+        return response
+
+    @staticmethod
+    def log(request, response, metrics, wall_time):
+        duplicates = metrics.duplicates()
+        record = {
+            "view": request.resolver_match.view_name if request.resolver_match else None,
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "queries": sum(metrics.queries.values()),
+            "duplicate_queries": sum(duplicates.values()) - len(duplicates),
+            "db_ms": round(metrics.db_time * 1000, 2),
+            "render_ms": round(metrics.render_time * 1000, 2),
+            "wall_ms": round(wall_time * 1000, 2),
+        }
+        if duplicates:
+            record["duplicates"] = {sql[:200]: count for sql, count in list(duplicates.items())[:5]}
+            logger.warning(json.dumps(record))
+        else:
+            logger.info(json.dumps(record))
+
+    def process_template_response(self, request, response):
+        started = time.perf_counter()
+
+        def rendered(response):
+            request.metrics.render_time += time.perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """WhiteNoise, made async capable.
+
+    WhiteNoise's own middleware is sync only, so under ASGI Django would run the whole middleware
+    chain, and every async view behind it, in a thread. Here a static file is served from a thread,
+    since it reads the disk, and any other request is passed straight on.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
@@ -0,0 +1,56 @@
+# Generated by Django 5.1.2 on 2026-10-18 09:12
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def delete_duplicates(apps, schema_editor):
+    # Keep the newest row of each (friend, match) and (friend, tournament) pair before they become unique.
+    # Totals can be recomputed afterwards with `manage.py rebuild_total_points`.
+    for model_name, key in [('TopScorerPoint', 'match'), ('TotalPoint', 'tournament')]:
+        model = apps.get_model('tournaments', model_name)
+        duplicates = model.objects.values('friend', key).annotate(rows=Count('id'), keep=Max('id')).filter(rows__gt=1)
+        for duplicate in duplicates:
+            model.objects.filter(friend=duplicate['friend'], **{key: duplicate[key]}).exclude(
+                pk=duplicate['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tournaments', '0027_scoringjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='groupprediction',
+            index=models.Index(fields=['match', 'friend'], include=('home_score', 'away_score'), name='group_prediction_match_friend'),
+        ),
+        migrations.AddIndex(
+            model_name='predictionresult',
+            index=models.Index(fields=['prediction'], include=('points', 'result'), name='prediction_result_points'),
+        ),
+        migrations.AddIndex(
+            model_name='scoringjob',
+            index=models.Index(fields=['status', 'created_at'], name='scoring_job_status_created_at'),
+        ),
+        migrations.AddIndex(
+            model_name='stagepoint',
+            index=models.Index(fields=['stage', '-points'], name='stage_point_stage_points'),
+        ),
+        migrations.AddIndex(
+            model_name='totalpoint',
+            index=models.Index(fields=['tournament', '-points'], include=('friend',), name='total_point_standings'),
+        ),
+        migrations.RunPython(delete_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='topscorerpoint',
+            constraint=models.UniqueConstraint(fields=('friend', 'match'), name='top_scorer_point_friend_match'),
+        ),
+        migrations.AddConstraint(
+            model_name='totalpoint',
+            constraint=models.UniqueConstraint(fields=('friend', 'tournament'), name='total_point_friend_tournament'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.2 on 2026-10-18 09:13
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_tournament(apps, schema_editor):
+    Stage = apps.get_model('tournaments', 'Stage')
+    Match = apps.get_model('tournaments', 'Match')
+    GroupPrediction = apps.get_model('tournaments', 'GroupPrediction')
+    PredictionResult = apps.get_model('tournaments', 'PredictionResult')
+    Match.objects.update(tournament=Subquery(Stage.objects.filter(pk=OuterRef('stage')).values('tournament')[:1]))
+    GroupPrediction.objects.update(
+        tournament=Subquery(Match.objects.filter(pk=OuterRef('match')).values('tournament')[:1]))
+    PredictionResult.objects.update(
+        tournament=Subquery(GroupPrediction.objects.filter(pk=OuterRef('prediction')).values('tournament')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tournaments', '0028_hot_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='groupprediction',
+            name='tournament',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='tournaments.tournament'),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='tournament',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='tournaments.tournament'),
+        ),
+        migrations.AddField(
+            model_name='predictionresult',
+            name='tournament',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='tournaments.tournament'),
+        ),
+        migrations.RunPython(backfill_tournament, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='groupprediction',
+            index=models.Index(fields=['tournament', 'friend'], name='group_prediction_tournament'),
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['tournament', '-start_time'], name='match_tournament_start_time'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.1.2 on 2026-10-18 09:15
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_stats(apps, schema_editor):
+    Match = apps.get_model('tournaments', 'Match')
+    PredictionResult = apps.get_model('tournaments', 'PredictionResult')
+    stats = PredictionResult.objects.values('prediction__match').annotate(
+        wrong_count=Count('pk', filter=Q(result='WO')),
+        hit_count=Count('pk', filter=Q(result='HI')),
+        bullseye_count=Count('pk', filter=Q(result='BU')),
+        not_participated_count=Count('pk', filter=Q(result='NO')),
+        points_sum=Sum('points'),
+    ).order_by()
+    fields = ['wrong_count', 'hit_count', 'bullseye_count', 'not_participated_count', 'points_sum']
+    matches = []
+    for row in stats:
+        match = Match(pk=row['prediction__match'])
+        for field in fields:
+            setattr(match, field, row[field] or 0)
+        matches.append(match)
+    Match.objects.bulk_update(matches, fields, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tournaments', '0029_denormalized_tournament'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='match',
+            name='bullseye_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='hit_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='not_participated_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='points_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='wrong_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
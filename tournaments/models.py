@@ -1,10 +1,33 @@
 from tokenize import group
 
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
-from django.db.models import Sum
-from django.db.models.signals import post_delete, post_save
-from django.dispatch import receiver
+from django.db import models, transaction
+from django.db.models import F, Sum
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import Signal, receiver
+
+from . import recompute, scoring
+
+# Sent with tournament_id whenever TotalPoint rows of a tournament change, including bulk and F() updates
+# that don't fire post_save.
+total_points_changed = Signal()
+
+# Sent with tournament_id and match_ids after score_matches() wrote the results and statistics of those
+# matches.
+matches_scored = Signal()
+
+# Sent with tournament_id and match_ids when matches are updated in bulk, without post_save.
+matches_updated = Signal()
+
+# Sent with tournament_id when predictions are updated in bulk, without post_save.
+predictions_updated = Signal()
+
+
+class SerializableQuerySet(models.QuerySet):
+    def for_serialize(self, *related):
+        """Load every relation serialize() walks, plus any extra related paths, in the same query."""
+        return self.select_related(*self.model.serialize_related, *related)
 
 
 class Tournament(models.Model):
@@ -60,6 +83,22 @@ class Match(models.Model):
     home_score = models.PositiveSmallIntegerField(default=None, null=True, blank=True)
     away_team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name="away", default=None, null=True)
     away_score = models.PositiveSmallIntegerField(default=None, null=True, blank=True)
+    # Copied from stage.tournament so tournament-wide queries don't have to join through Stage.
+    tournament = models.ForeignKey(Tournament, on_delete=models.CASCADE, null=True, editable=False)
+    # Prediction statistics of the match page, refreshed by score_matches().
+    wrong_count = models.PositiveIntegerField(default=0, editable=False)
+    hit_count = models.PositiveIntegerField(default=0, editable=False)
+    bullseye_count = models.PositiveIntegerField(default=0, editable=False)
+    not_participated_count = models.PositiveIntegerField(default=0, editable=False)
+    points_sum = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = SerializableQuerySet.as_manager()
+    serialize_related = ('stage', 'home_team', 'away_team')
+
+    def save(self, *args, **kwargs):
+        if self._state.adding or self.stage_id != self._loaded_stage_id:
+            self.tournament_id = self.stage.tournament_id if self.stage_id else None
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f'{self.stage} || {self.number} || {self.user_friendly()}'
@@ -67,6 +106,9 @@ class Match(models.Model):
     def is_finished(self):
         return self.home_score is not None and self.away_score is not None
 
+    def predictions_count(self):
+        return self.wrong_count + self.hit_count + self.bullseye_count + self.not_participated_count
+
     @staticmethod
     def team_str(team):
         return with_default(team, "Unknown")
@@ -110,6 +152,12 @@ class Match(models.Model):
                 fields=['stage', 'home_team', 'away_team']
             )
         ]
+        indexes = [
+            models.Index(
+                name="match_tournament_start_time",
+                fields=['tournament', '-start_time']
+            )
+        ]
         verbose_name_plural = "Matches"
         ordering = ['-start_time', 'stage', '-number']
 
@@ -119,6 +167,15 @@ class GroupPrediction(models.Model):
     match = models.ForeignKey(Match, on_delete=models.CASCADE)
     home_score = models.PositiveSmallIntegerField(null=True)
     away_score = models.PositiveSmallIntegerField(null=True)
+    tournament = models.ForeignKey(Tournament, on_delete=models.CASCADE, null=True, editable=False)
+
+    objects = SerializableQuerySet.as_manager()
+    serialize_related = ('friend', 'match__stage', 'match__home_team', 'match__away_team')
+
+    def save(self, *args, **kwargs):
+        if self.tournament_id is None or self.match_id != self._loaded_match_id:
+            self.tournament_id = self.match.tournament_id
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return (f'{self.friend.first_name.capitalize()} {self.friend.last_name.capitalize()} '
@@ -154,6 +211,17 @@ class GroupPrediction(models.Model):
                 fields=['friend', 'match']
             )
         ]
+        indexes = [
+            models.Index(
+                name="group_prediction_match_friend",
+                fields=['match', 'friend'],
+                include=['home_score', 'away_score']
+            ),
+            models.Index(
+                name="group_prediction_tournament",
+                fields=['tournament', 'friend']
+            )
+        ]
 
     def is_hit(self):
         return ((self.home_score - self.away_score > 0 and self.match.home_score - self.match.away_score > 0)
@@ -174,6 +242,9 @@ class StagePoint(models.Model):
     stage = models.ForeignKey(Stage, on_delete=models.CASCADE)
     points = models.PositiveSmallIntegerField(default=0)
 
+    objects = SerializableQuerySet.as_manager()
+    serialize_related = ('friend', 'stage')
+
     def serialize(self):
         return {
             "friend": serialize_friend(self.friend),
@@ -191,6 +262,12 @@ class StagePoint(models.Model):
                 fields=['friend', 'stage']
             )
         ]
+        indexes = [
+            models.Index(
+                name="stage_point_stage_points",
+                fields=['stage', '-points']
+            )
+        ]
         ordering = ['stage', '-points', '-friend']
 
 
@@ -199,6 +276,9 @@ class TopScorerPoint(models.Model):
     match = models.ForeignKey(Match, on_delete=models.CASCADE)
     points = models.PositiveSmallIntegerField(default=0)
 
+    objects = SerializableQuerySet.as_manager()
+    serialize_related = ('friend', 'match__stage', 'match__home_team', 'match__away_team')
+
     def __str__(self):
         return (f"{self.friend.first_name.capitalize()} {self.friend.last_name.capitalize()} "
                 f"|| {self.match} "
@@ -211,12 +291,23 @@ class TopScorerPoint(models.Model):
             "points": self.points,
         }
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                name="top_scorer_point_friend_match",
+                fields=['friend', 'match']
+            )
+        ]
+
 
 class TotalPoint(models.Model):
     friend = models.ForeignKey(User, on_delete=models.CASCADE)
     tournament = models.ForeignKey(Tournament, on_delete=models.CASCADE)
     points = models.PositiveSmallIntegerField(default=0)
 
+    objects = SerializableQuerySet.as_manager()
+    serialize_related = ('friend', 'tournament')
+
     def __str__(self):
         return (f"{self.friend.first_name.capitalize()} {self.friend.last_name.capitalize()} "
                 f"|| {self.tournament} "
@@ -230,6 +321,19 @@ class TotalPoint(models.Model):
         }
 
     class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                name="total_point_friend_tournament",
+                fields=['friend', 'tournament']
+            )
+        ]
+        indexes = [
+            models.Index(
+                name="total_point_standings",
+                fields=['tournament', '-points'],
+                include=['friend']
+            )
+        ]
         ordering = ['-points', '-friend']
 
 
@@ -248,6 +352,25 @@ class PredictionResult(models.Model):
         default=None,
         null=True
     )
+    tournament = models.ForeignKey(Tournament, on_delete=models.CASCADE, null=True, editable=False)
+
+    objects = SerializableQuerySet.as_manager()
+    serialize_related = ('prediction__friend', 'prediction__match__stage', 'prediction__match__home_team',
+                         'prediction__match__away_team')
+
+    class Meta:
+        indexes = [
+            models.Index(
+                name="prediction_result_points",
+                fields=['prediction'],
+                include=['points', 'result']
+            )
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.tournament_id is None or self.prediction_id != self._loaded_prediction_id:
+            self.tournament_id = self.prediction.tournament_id
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.prediction} || points: {self.points} || {self.result}"
@@ -268,89 +391,363 @@ class PredictionResult(models.Model):
         return self.points == 3 and self.result == self.Result.HIT
 
 
-def update_total_points(friend, tournament):
-    top_scorer_points = TopScorerPoint.objects.filter(
-        friend=friend,
-        match__stage__tournament=tournament
-    ).aggregate(total=Sum('points'))['total'] or 0
-
-    prediction_points = PredictionResult.objects.filter(
-        prediction__friend=friend,
-        prediction__match__stage__tournament=tournament
-    ).aggregate(total=Sum('points'))['total'] or 0
+def rebuild_total_points(tournament_id, friend_ids=None):
+    """Recompute the TotalPoint rows of a tournament with one grouped aggregate per points table.
 
-    stage_points = StagePoint.objects.filter(
-        friend=friend,
-        stage__tournament=tournament
-    ).aggregate(total=Sum('points'))['total'] or 0
-
-    total_points = top_scorer_points + prediction_points + stage_points
-    TotalPoint.objects.update_or_create(
-        friend=friend,
-        tournament=tournament,
-        defaults={'points': total_points}
+    Only the friends in friend_ids are touched when it's given. The rows are written with bulk
+    operations, so no post_save receivers run for them.
+    """
+    recompute.discard(
+        apply_total_points_deltas,
+        lambda key: key[1] == tournament_id and (friend_ids is None or key[0] in friend_ids)
+    )
+    top_scorer_points = TopScorerPoint.objects.filter(match__tournament=tournament_id)
+    prediction_points = PredictionResult.objects.filter(tournament=tournament_id)
+    stage_points = StagePoint.objects.filter(stage__tournament=tournament_id)
+    total_points = TotalPoint.objects.filter(tournament=tournament_id)
+    if friend_ids is not None:
+        top_scorer_points = top_scorer_points.filter(friend__in=friend_ids)
+        prediction_points = prediction_points.filter(prediction__friend__in=friend_ids)
+        stage_points = stage_points.filter(friend__in=friend_ids)
+        total_points = total_points.filter(friend__in=friend_ids)
+
+    totals = {friend_id: 0 for friend_id in friend_ids or []}
+    for points, friend_field in [(top_scorer_points, 'friend'),
+                                 (prediction_points, 'prediction__friend'),
+                                 (stage_points, 'friend')]:
+        for row in points.values(friend_field).annotate(total=Sum('points')).order_by():
+            totals[row[friend_field]] = totals.get(row[friend_field], 0) + (row['total'] or 0)
+
+    existing = {tp.friend_id: tp for tp in total_points}
+    to_create, to_update = [], []
+    for friend_id, points in totals.items():
+        total_point = existing.get(friend_id)
+        if total_point is None:
+            to_create.append(TotalPoint(friend_id=friend_id, tournament_id=tournament_id, points=points))
+        elif total_point.points != points:
+            total_point.points = points
+            to_update.append(total_point)
+    for friend_id, total_point in existing.items():
+        if friend_id not in totals and total_point.points != 0:
+            total_point.points = 0
+            to_update.append(total_point)
+
+    with transaction.atomic():
+        TotalPoint.objects.bulk_create(to_create)
+        TotalPoint.objects.bulk_update(to_update, ['points'])
+    if to_create or to_update:
+        total_points_changed.send(sender=TotalPoint, tournament_id=tournament_id)
+    return to_create + to_update
+
+
+def apply_total_points_delta(friend_id, tournament_id, delta):
+    """Add delta to a friend's TotalPoint with an atomic F() update, building the row if it's missing.
+
+    Nothing is built when the tournament or the friend was deleted since the delta was deferred.
+    """
+    updated = TotalPoint.objects.filter(
+        friend=friend_id,
+        tournament=tournament_id
+    ).update(points=F('points') + delta)
+    if not updated:
+        if Tournament.objects.filter(pk=tournament_id).exists() and User.objects.filter(pk=friend_id).exists():
+            rebuild_total_points(tournament_id, [friend_id])
+    elif delta:
+        total_points_changed.send(sender=TotalPoint, tournament_id=tournament_id)
+
+
+def apply_total_points_deltas(deltas):
+    for (friend_id, tournament_id), delta in deltas.items():
+        apply_total_points_delta(friend_id, tournament_id, delta)
+
+
+def points_delta(instance, created=False, deleted=False):
+    old_points = 0 if created else instance._loaded_points
+    new_points = 0 if deleted else instance.points
+    instance._loaded_points = new_points
+    return new_points - old_points
+
+
+@receiver(post_init, sender=PredictionResult)
+@receiver(post_init, sender=TopScorerPoint)
+@receiver(post_init, sender=StagePoint)
+def remember_loaded_points(sender, instance, **kwargs):
+    # Read from __dict__ so loading the rows with points deferred doesn't query for it.
+    instance._loaded_points = instance.__dict__.get('points')
+
+
+@receiver(pre_save, sender=PredictionResult)
+@receiver(pre_save, sender=TopScorerPoint)
+@receiver(pre_save, sender=StagePoint)
+@receiver(pre_delete, sender=PredictionResult)
+@receiver(pre_delete, sender=TopScorerPoint)
+@receiver(pre_delete, sender=StagePoint)
+def load_deferred_points(sender, instance, **kwargs):
+    if instance._loaded_points is None and not instance._state.adding:
+        instance._loaded_points = sender.objects.filter(pk=instance.pk).values_list('points', flat=True).first() or 0
+
+
+@receiver(post_init, sender=PredictionResult)
+def remember_loaded_result(sender, instance, **kwargs):
+    instance._loaded_result = instance.__dict__.get('result')
+
+
+@receiver(pre_save, sender=PredictionResult)
+@receiver(pre_delete, sender=PredictionResult)
+def load_deferred_result(sender, instance, **kwargs):
+    if not instance._state.adding and None in (instance._loaded_prediction_id, instance._loaded_result):
+        stored = sender.objects.filter(pk=instance.pk).values_list('prediction', 'result').first()
+        if stored is not None:
+            instance._loaded_prediction_id, instance._loaded_result = stored
+
+
+@receiver(post_save, sender=PredictionResult)
+@receiver(post_delete, sender=PredictionResult)
+def update_total_points_after_prediction_result(sender, instance, signal, created=False, **kwargs):
+    """Apply a result's change to the TotalPoint of its friend and to the statistics stored on its match.
+
+    The result as it was loaded is taken away and the result as it is now added, so a result that
+    moved to another prediction updates both friends and both matches.
+    """
+    deleted = signal is post_delete
+    old = None if created else (instance._loaded_prediction_id, instance._loaded_points, instance._loaded_result)
+    new = None if deleted else (instance.prediction_id, instance.points, instance.result)
+    instance._loaded_points, instance._loaded_result = new[1:] if new else (0, None)
+    if old == new:
+        return
+
+    predictions = {
+        prediction_id: (friend_id, match_id, tournament_id)
+        for prediction_id, friend_id, match_id, tournament_id in GroupPrediction.objects.filter(
+            pk__in={state[0] for state in (old, new) if state}
+        ).values_list('pk', 'friend', 'match', 'tournament')
+    }
+    stats = {}
+    for sign, state in [(-1, old), (1, new)]:
+        if state is None or state[0] not in predictions:
+            continue
+        prediction_id, points, result = state
+        friend_id, match_id, tournament_id = predictions[prediction_id]
+        recompute.defer(apply_total_points_deltas, (friend_id, tournament_id), sign * points)
+        add_match_stats(stats, match_id, sign, points, result)
+    update_match_stats(stats)
+
+
+def add_match_stats(stats, match_id, sign, points, result):
+    match_stats = stats.setdefault(match_id, {})
+    for field, change in [(RESULT_COUNT_FIELDS[result], sign), ('points_sum', sign * points)]:
+        match_stats[field] = match_stats.get(field, 0) + change
+
+
+def update_match_stats(stats):
+    """Apply {match_id: {field: change}} to the statistics stored on the matches with F() updates.
+
+    update() doesn't send the Match signals, which would score the matches again.
+    """
+    for match_id, changes in stats.items():
+        changes = {field: F(field) + change for field, change in changes.items() if change}
+        if changes:
+            Match.objects.filter(pk=match_id).update(**changes)
+
+
+@receiver(post_save, sender=TopScorerPoint)
+@receiver(post_delete, sender=TopScorerPoint)
+def update_total_points_after_top_scorer_point(sender, instance, signal, created=False, **kwargs):
+    delta = points_delta(instance, created=created, deleted=signal is post_delete)
+    if delta or created:
+        tournament_id = Match.objects.filter(pk=instance.match_id).values_list('tournament', flat=True).get()
+        recompute.defer(apply_total_points_deltas, (instance.friend_id, tournament_id), delta)
+
+
+@receiver(post_save, sender=StagePoint)
+@receiver(post_delete, sender=StagePoint)
+def update_total_points_after_stage_point(sender, instance, signal, created=False, **kwargs):
+    delta = points_delta(instance, created=created, deleted=signal is post_delete)
+    if delta or created:
+        recompute.defer(apply_total_points_deltas, (instance.friend_id, instance.stage.tournament_id), delta)
+
+
+RESULT_COUNT_FIELDS = {
+    PredictionResult.Result.WRONG: 'wrong_count',
+    PredictionResult.Result.HIT: 'hit_count',
+    PredictionResult.Result.BULLSEYE: 'bullseye_count',
+    PredictionResult.Result.NOT_PARTICIPATED: 'not_participated_count',
+}
+MATCH_STATS_FIELDS = [*RESULT_COUNT_FIELDS.values(), 'points_sum']
+OUTCOME_RESULTS = {
+    scoring.NOT_PARTICIPATED: PredictionResult.Result.NOT_PARTICIPATED,
+    scoring.WRONG: PredictionResult.Result.WRONG,
+    scoring.HIT: PredictionResult.Result.HIT,
+    scoring.BULLSEYE: PredictionResult.Result.BULLSEYE,
+}
+
+
+def score_matches(matches, rebuild_totals=True):
+    """Score every prediction of the given matches and rebuild the totals of the friends involved.
+
+    The predictions are read as plain columns and scored together by tournaments.scoring. Only
+    the results that changed are written, with bulk_create/bulk_update in one transaction, so the
+    per-row PredictionResult receivers don't fire. The affected TotalPoint rows are then recomputed
+    once per tournament instead of once per result, and the prediction statistics stored on each
+    match are refreshed from the same pass. With rebuild_totals=False the totals are left to the
+    caller, which rebuilds them once after scoring many batches (see rescore_stage).
+    """
+    rules = MatchPointRule.objects.filter(stage__in={m.stage_id for m in matches})
+    rules = {rule.stage_id: rule for rule in rules}
+    matches = {m.pk: m for m in matches if m.stage_id in rules}
+    if not matches:
+        return []
+
+    for match in matches.values():
+        for field in MATCH_STATS_FIELDS:
+            setattr(match, field, 0)
+
+    rows = list(GroupPrediction.objects.filter(match__in=matches.keys()).values_list(
+        'pk', 'friend', 'match', 'home_score', 'away_score',
+        'predictionresult', 'predictionresult__points', 'predictionresult__result'
+    ))
+    scored_matches = {}
+    for match in matches.values():
+        rule = rules[match.stage_id]
+        scored_matches[match.pk] = (match.home_score, match.away_score, rule.wrong, rule.hit, rule.bullseye)
+    all_points, outcomes = scoring.score_predictions(
+        [(match_id, home_score, away_score) for _, _, match_id, home_score, away_score, _, _, _ in rows],
+        scored_matches
     )
 
+    to_create, to_update = [], []
+    friends_by_tournament = {}
+    for row, points, outcome in zip(rows, all_points, outcomes):
+        prediction_id, friend_id, match_id, _, _, result_id, old_points, old_result = row
+        match = matches[match_id]
+        result = OUTCOME_RESULTS[outcome]
+        field = RESULT_COUNT_FIELDS[result]
+        setattr(match, field, getattr(match, field) + 1)
+        match.points_sum += points
+        if result_id is None:
+            to_create.append(PredictionResult(prediction_id=prediction_id, tournament_id=match.tournament_id,
+                                              points=points, result=result))
+        elif old_points != points or old_result != result:
+            to_update.append(PredictionResult(pk=result_id, prediction_id=prediction_id, points=points,
+                                              result=result))
+        else:
+            continue
+        friends_by_tournament.setdefault(match.tournament_id, set()).add(friend_id)
 
-@receiver([post_save, post_delete], sender=PredictionResult)
-def update_total_points_after_prediction_result(sender, instance, **kwargs):
-    tournament = instance.prediction.match.stage.tournament
-    friend = instance.prediction.friend
-    update_total_points(friend, tournament)
+    with transaction.atomic():
+        PredictionResult.objects.bulk_create(to_create)
+        PredictionResult.objects.bulk_update(to_update, ['points', 'result'])
+        # bulk_update() skips the Match signals, which would queue the matches for scoring again.
+        Match.objects.bulk_update(matches.values(), MATCH_STATS_FIELDS)
+        if rebuild_totals:
+            for tournament_id, friend_ids in friends_by_tournament.items():
+                rebuild_total_points(tournament_id, friend_ids)
 
+    match_ids_by_tournament = {}
+    for match in matches.values():
+        match_ids_by_tournament.setdefault(match.tournament_id, []).append(match.pk)
+    for tournament_id, match_ids in match_ids_by_tournament.items():
+        matches_scored.send(sender=Match, tournament_id=tournament_id, match_ids=match_ids)
+    return to_create + to_update
 
-@receiver([post_save, post_delete], sender=TopScorerPoint)
-def update_total_points_after_top_scorer_point(sender, instance, **kwargs):
-    tournament = instance.match.stage.tournament
-    friend = instance.friend
-    update_total_points(friend, tournament)
 
+RESCORE_CHUNK_SIZE = 10
 
-@receiver([post_save, post_delete], sender=StagePoint)
-def update_total_points_after_stage_point(sender, instance, **kwargs):
-    tournament = instance.stage.tournament
-    friend = instance.friend
-    update_total_points(friend, tournament)
 
+def rescore_stage(stage_id, chunk_size=RESCORE_CHUNK_SIZE, progress=None):
+    """Rescore every match of a stage with its current MatchPointRule, chunk_size matches at a time.
 
-def is_hit(prediction, match):
-    return ((prediction.home_score - prediction.away_score > 0 and match.home_score - match.away_score > 0)
-            or (prediction.home_score - prediction.away_score < 0 and match.home_score - match.away_score < 0)
-            or (prediction.home_score - prediction.away_score == 0 and match.home_score - match.away_score == 0))
+    Each chunk is scored and written in its own transaction. Results that already match the rule
+    aren't written, so running it again is harmless. TotalPoint isn't touched: rebuild it with
+    rebuild_total_points() once every stage is done. progress is called with (stage_id, done, total)
+    after each chunk. Return the number of PredictionResults written.
+    """
+    match_ids = list(Match.objects.filter(stage=stage_id).order_by('start_time', 'pk').values_list('pk', flat=True))
+    written = 0
+    for start in range(0, len(match_ids), chunk_size):
+        chunk = list(Match.objects.filter(pk__in=match_ids[start:start + chunk_size]))
+        written += len(score_matches(chunk, rebuild_totals=False))
+        if progress is not None:
+            progress(stage_id, min(start + chunk_size, len(match_ids)), len(match_ids))
+    return written
 
 
-def same_scores(prediction, match):
-    return prediction.home_score == match.home_score and prediction.away_score == match.away_score
+def score_saved_matches(match_ids):
+    if settings.ASYNC_SCORING:
+        enqueue_scoring_jobs(match_ids)
+    else:
+        score_matches(list(Match.objects.filter(pk__in=match_ids)))
 
 
-def get_points_and_result(rule, prediction, match):
-    points = rule.wrong
-    result = PredictionResult.Result.WRONG
+@receiver(post_save, sender=Match)
+def update_prediction_results(sender, instance, **kwargs):
+    recompute.defer(score_saved_matches, instance.pk)
+
+
+def enter_scores(scores):
+    """Set the final scores of several matches, {match_id: (home_score, away_score)}, and score them together.
+
+    The matches are written with one bulk_update() instead of a save() each, and all of them are
+    scored in a single pass when the transaction commits, so the totals of every friend are rebuilt
+    once per tournament rather than once per match.
+    """
+    with transaction.atomic():
+        # The teams are loaded for the caller, which usually lists the entered matches.
+        matches = list(Match.objects.filter(pk__in=scores.keys()).select_related('home_team', 'away_team'))
+        missing = set(scores).difference(match.pk for match in matches)
+        if missing:
+            raise Match.DoesNotExist(f"No matches with ids {sorted(missing)}")
+        for match in matches:
+            match.home_score, match.away_score = scores[match.pk]
+        Match.objects.bulk_update(matches, ['home_score', 'away_score'])
+
+        match_ids_by_tournament = {}
+        for match in matches:
+            match_ids_by_tournament.setdefault(match.tournament_id, []).append(match.pk)
+            recompute.defer(score_saved_matches, match.pk)
+        for tournament_id, match_ids in match_ids_by_tournament.items():
+            matches_updated.send(sender=Match, tournament_id=tournament_id, match_ids=match_ids)
+    return matches
+
+
+class ScoringJob(models.Model):
+    class Status(models.TextChoices):
+        PENDING = "PE",
+        RUNNING = "RU",
+        DONE = "DO",
+        FAILED = "FA"
+
+    match = models.ForeignKey(Match, on_delete=models.CASCADE)
+    status = models.CharField(max_length=2, choices=Status, default=Status.PENDING)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
 
-    if is_hit(prediction, match):
-        points = rule.hit
-        result = PredictionResult.Result.HIT
+    class Meta:
+        indexes = [
+            models.Index(
+                name="scoring_job_status_created_at",
+                fields=['status', 'created_at']
+            )
+        ]
+        ordering = ['-created_at']
 
-    if same_scores(prediction, match):
-        points = rule.bullseye
-        result = PredictionResult.Result.BULLSEYE
+    def __str__(self):
+        return f"{self.match} || {self.get_status_display()}"
 
-    return points, result
 
+def enqueue_scoring_jobs(match_ids):
+    """Queue a ScoringJob for each match that doesn't already have one waiting for the worker.
 
-@receiver(post_save, sender=Match)
-def update_prediction_results(sender, instance, **kwargs):
-    match_point_rule = MatchPointRule.objects.filter(stage=instance.stage).first()
-    if match_point_rule is None:
-        return None
-    gps = GroupPrediction.objects.filter(match=instance)
-    for gp in gps:
-        if not instance.is_finished():
-            points, result = 0, PredictionResult.Result.NOT_PARTICIPATED
-        else:
-            points, result = get_points_and_result(match_point_rule, gp, instance)
-        PredictionResult.objects.update_or_create(prediction=gp,
-                                                  defaults={'points': points, 'result': result})
+    Matches deleted in the meantime are skipped.
+    """
+    waiting = set(ScoringJob.objects.filter(
+        match__in=match_ids,
+        status=ScoringJob.Status.PENDING
+    ).values_list('match', flat=True))
+    match_ids = Match.objects.filter(pk__in=match_ids).exclude(pk__in=waiting).values_list('pk', flat=True)
+    ScoringJob.objects.bulk_create([ScoringJob(match_id=match_id) for match_id in match_ids])
 
 
 class MatchPointRule(models.Model):
@@ -378,35 +775,95 @@ class RegisteredTournament(models.Model):
 
 @receiver(post_save, sender=RegisteredTournament)
 def create_start_predictions(sender, instance, **kwargs):
-    matches = Match.objects.filter(stage__tournament=instance.tournament)
-    for match in matches:
-        GroupPrediction.objects.get_or_create(
-            friend=instance.friend,
-            match=match,
-            defaults={
-                "home_score": None,
-                "away_score": None,
-            }
-        )
+    matches = list(Match.objects.filter(tournament=instance.tournament_id))
+    GroupPrediction.objects.bulk_create(
+        [GroupPrediction(friend_id=instance.friend_id, match=match, tournament_id=match.tournament_id)
+         for match in matches],
+        ignore_conflicts=True
+    )
+    for stage_id in {match.stage_id for match in matches}:
+        rebuild_group_tables(stage_id, [instance.friend_id])
+
+
+@receiver(post_init, sender=Match)
+def remember_loaded_match(sender, instance, **kwargs):
+    instance._loaded_teams = (instance.__dict__.get('home_team_id'), instance.__dict__.get('away_team_id'))
+    instance._loaded_stage_id = instance.__dict__.get('stage_id')
+    instance._loaded_tournament_id = instance.__dict__.get('tournament_id')
+
 
 @receiver(post_save, sender=Match)
-def create_start_predictions_on_match_save(sender, instance, **kwargs):
-    rts = RegisteredTournament.objects.filter(tournament=instance.stage.tournament)
-    for rt in rts:
-        print(rt.friend)
-        GroupPrediction.objects.get_or_create(
-            friend=rt.friend,
-            match=instance,
-            defaults={
-                "home_score": None,
-                "away_score": None,
-            }
-        )
+def move_predictions_with_match(sender, instance, created, **kwargs):
+    if not created and instance.tournament_id != instance._loaded_tournament_id:
+        GroupPrediction.objects.filter(match=instance).update(tournament=instance.tournament_id)
+        PredictionResult.objects.filter(prediction__match=instance).update(tournament=instance.tournament_id)
+    instance._loaded_stage_id = instance.stage_id
+    instance._loaded_tournament_id = instance.tournament_id
+
+
+@receiver(post_init, sender=GroupPrediction)
+def remember_loaded_prediction_match(sender, instance, **kwargs):
+    instance._loaded_match_id = instance.__dict__.get('match_id')
+    instance._loaded_tournament_id = instance.__dict__.get('tournament_id')
+
+
+@receiver(post_init, sender=PredictionResult)
+def remember_loaded_result_prediction(sender, instance, **kwargs):
+    instance._loaded_prediction_id = instance.__dict__.get('prediction_id')
+
+
+@receiver(post_save, sender=GroupPrediction)
+def move_results_with_prediction(sender, instance, created, **kwargs):
+    if not created and instance.tournament_id != instance._loaded_tournament_id:
+        PredictionResult.objects.filter(prediction=instance).update(tournament=instance.tournament_id)
+    if not created and instance._loaded_match_id is not None and instance.match_id != instance._loaded_match_id:
+        # The prediction's results are counted in the statistics of the match it moved to.
+        stats = {}
+        for points, result in PredictionResult.objects.filter(prediction=instance).values_list('points', 'result'):
+            add_match_stats(stats, instance._loaded_match_id, -1, points, result)
+            add_match_stats(stats, instance.match_id, 1, points, result)
+        update_match_stats(stats)
+    instance._loaded_match_id = instance.match_id
+    instance._loaded_tournament_id = instance.tournament_id
+
+
+@receiver(post_save, sender=PredictionResult)
+def remember_saved_result_prediction(sender, instance, **kwargs):
+    instance._loaded_prediction_id = instance.prediction_id
+
+
+@receiver(post_save, sender=Stage)
+def move_matches_with_stage(sender, instance, created, **kwargs):
+    if created:
+        return
+    moved = Match.objects.filter(stage=instance).exclude(tournament=instance.tournament_id)
+    if moved.update(tournament=instance.tournament_id):
+        GroupPrediction.objects.filter(match__stage=instance).update(tournament=instance.tournament_id)
+        PredictionResult.objects.filter(prediction__match__stage=instance).update(tournament=instance.tournament_id)
+
+
+@receiver(post_save, sender=Match)
+def create_start_predictions_on_match_save(sender, instance, created, **kwargs):
+    teams = (instance.home_team_id, instance.away_team_id)
+    teams_changed = teams != instance._loaded_teams
+    instance._loaded_teams = teams
+    if not (created or teams_changed) or instance.stage_id is None:
+        return
+
+    friend_ids = list(RegisteredTournament.objects.filter(
+        tournament=instance.tournament_id
+    ).values_list('friend', flat=True))
+    GroupPrediction.objects.bulk_create(
+        [GroupPrediction(friend_id=friend_id, match=instance, tournament_id=instance.tournament_id)
+         for friend_id in friend_ids],
+        ignore_conflicts=True
+    )
+    rebuild_group_tables(instance.stage_id, friend_ids)
 
 
 @receiver(post_delete, sender=RegisteredTournament)
-def create_start_predictions(sender, instance, **kwargs):
-    GroupPrediction.objects.filter(match__stage__tournament=instance.tournament, friend=instance.friend).delete()
+def delete_predictions_on_unregister(sender, instance, **kwargs):
+    GroupPrediction.objects.filter(tournament=instance.tournament_id, friend=instance.friend_id).delete()
 
 
 class GroupRow(models.Model):
@@ -421,6 +878,9 @@ class GroupRow(models.Model):
     gf = models.PositiveSmallIntegerField(default=0)
     ga = models.PositiveSmallIntegerField(default=0)
 
+    objects = SerializableQuerySet.as_manager()
+    serialize_related = ('friend', 'stage__tournament', 'team')
+
     class Meta:
         constraints = [
             models.UniqueConstraint(
@@ -456,10 +916,10 @@ class GroupRow(models.Model):
             "goal_difference": self.goal_difference(),
         }
 
-def default_group_row(friend, stage, team):
+def default_group_row(friend_id, stage_id, team):
     return GroupRow(
-        friend=friend,
-        stage=stage,
+        friend_id=friend_id,
+        stage_id=stage_id,
         team=team,
         position=0,
         pld=0,
@@ -471,42 +931,154 @@ def default_group_row(friend, stage, team):
     )
 
 
-@receiver(post_save, sender=GroupPrediction)
-def create_start_predictions(sender, instance, **kwargs):
-    group_predictions = GroupPrediction.objects.filter(match__stage=instance.match.stage, friend=instance.friend)
-    GroupRow.objects.filter(friend=instance.friend, stage=instance.match.stage).delete()
-    teams = set([group_prediction.match.home_team for group_prediction in group_predictions]) | set([group_prediction.match.away_team for group_prediction in group_predictions])
-    group_table = {team.name: default_group_row(instance.friend, instance.match.stage, team) for team in teams}
+def build_group_table(friend_id, stage_id, group_predictions):
+    teams = [team for gp in group_predictions for team in (gp.match.home_team, gp.match.away_team) if team]
+    group_table = {team.pk: default_group_row(friend_id, stage_id, team) for team in teams}
 
     for group_prediction in group_predictions:
         if group_prediction.home_score is None or group_prediction.away_score is None:
             continue
-        team_name = group_prediction.match.home_team.name
-        group_table[team_name].pld += 1
-        group_table[team_name].wins += 1 if group_prediction.is_home_win() else 0
-        group_table[team_name].draws += 1 if group_prediction.is_draw() else 0
-        group_table[team_name].losses += 1 if group_prediction.is_away_win() else 0
-        group_table[team_name].gf += group_prediction.home_score
-        group_table[team_name].ga += group_prediction.away_score
-
-        team_name = group_prediction.match.away_team.name
-        group_table[team_name].pld += 1
-        group_table[team_name].wins += 1 if group_prediction.is_away_win() else 0
-        group_table[team_name].draws += 1 if group_prediction.is_draw() else 0
-        group_table[team_name].losses += 1 if group_prediction.is_home_win() else 0
-        group_table[team_name].gf += group_prediction.away_score
-        group_table[team_name].ga += group_prediction.home_score
+        if group_prediction.match.home_team_id is None or group_prediction.match.away_team_id is None:
+            continue
+        row = group_table[group_prediction.match.home_team_id]
+        row.pld += 1
+        row.wins += 1 if group_prediction.is_home_win() else 0
+        row.draws += 1 if group_prediction.is_draw() else 0
+        row.losses += 1 if group_prediction.is_away_win() else 0
+        row.gf += group_prediction.home_score
+        row.ga += group_prediction.away_score
+
+        row = group_table[group_prediction.match.away_team_id]
+        row.pld += 1
+        row.wins += 1 if group_prediction.is_away_win() else 0
+        row.draws += 1 if group_prediction.is_draw() else 0
+        row.losses += 1 if group_prediction.is_home_win() else 0
+        row.gf += group_prediction.away_score
+        row.ga += group_prediction.home_score
 
     rows = list(group_table.values())
-    rows.sort(key=lambda x: x.points(), reverse=True)
+    rank_group_rows(rows)
+    return rows
+
 
+def rank_group_rows(rows):
+    rows.sort(key=lambda row: row.points(), reverse=True)
     for i in range(len(rows)):
         rows[i].position = i + 1
 
-    for row in rows:
-        row.save()
 
-    return []
+def rebuild_group_tables(stage_id, friend_ids):
+    """Rebuild the group table of each friend for a stage with one read and one bulk insert."""
+    recompute.discard(update_group_tables, lambda key: key[1] == stage_id and key[0] in friend_ids)
+    group_predictions = GroupPrediction.objects.filter(
+        match__stage=stage_id,
+        friend__in=friend_ids
+    ).select_related('match__home_team', 'match__away_team')
+    predictions_by_friend = {friend_id: [] for friend_id in friend_ids}
+    for group_prediction in group_predictions:
+        predictions_by_friend[group_prediction.friend_id].append(group_prediction)
+
+    rows = []
+    for friend_id, friend_predictions in predictions_by_friend.items():
+        rows += build_group_table(friend_id, stage_id, friend_predictions)
+
+    with transaction.atomic():
+        GroupRow.objects.filter(stage=stage_id, friend__in=friend_ids).delete()
+        GroupRow.objects.bulk_create(rows)
+    return rows
+
+
+def save_stage_predictions(stage_id, friend_id, predictions):
+    """Write a friend's changed predictions for a stage with one bulk_update() and rebuild their group table once."""
+    if not predictions:
+        return
+    with transaction.atomic():
+        GroupPrediction.objects.bulk_update(predictions, ['home_score', 'away_score'])
+        rebuild_group_tables(stage_id, [friend_id])
+    for prediction in predictions:
+        prediction._loaded_scores = (prediction.home_score, prediction.away_score)
+    predictions_updated.send(sender=GroupPrediction, tournament_id=predictions[0].tournament_id)
+
+
+GROUP_ROW_FIELDS = ('pld', 'wins', 'draws', 'losses', 'gf', 'ga')
+
+
+def group_row_contribution(goals_for, goals_against):
+    if goals_for is None or goals_against is None:
+        return dict.fromkeys(GROUP_ROW_FIELDS, 0)
+    return {
+        'pld': 1,
+        'wins': int(goals_for > goals_against),
+        'draws': int(goals_for == goals_against),
+        'losses': int(goals_for < goals_against),
+        'gf': goals_for,
+        'ga': goals_against,
+    }
+
+
+def group_table_deltas(match, old_scores, new_scores):
+    """How replacing a predicted result of match with another changes each team's group row.
+
+    Returns {team_id: {field: difference}} for both teams of the match, even when nothing changes.
+    """
+    deltas = {}
+    for team_id, (old_for, old_against), (new_for, new_against) in [
+        (match.home_team_id, old_scores, new_scores),
+        (match.away_team_id, old_scores[::-1], new_scores[::-1]),
+    ]:
+        if team_id is None:
+            continue
+        old = group_row_contribution(old_for, old_against)
+        new = group_row_contribution(new_for, new_against)
+        deltas[team_id] = {field: new[field] - old[field] for field in GROUP_ROW_FIELDS}
+    return deltas
+
+
+def apply_group_table_deltas(friend_id, stage_id, deltas):
+    """Apply group_table_deltas to a friend's stored group table, re-rank it and bulk_update it.
+
+    Returns False without writing anything when a team has no row yet, so the table has to be rebuilt.
+    """
+    rows = list(GroupRow.objects.filter(friend=friend_id, stage=stage_id))
+    rows_by_team = {row.team_id: row for row in rows}
+    if any(team_id not in rows_by_team for team_id in deltas):
+        return False
+    if not any(any(delta.values()) for delta in deltas.values()):
+        return True
+
+    for team_id, delta in deltas.items():
+        row = rows_by_team[team_id]
+        for field, difference in delta.items():
+            setattr(row, field, getattr(row, field) + difference)
+    rank_group_rows(rows)
+    GroupRow.objects.bulk_update(rows, [*GROUP_ROW_FIELDS, 'position'])
+    return True
+
+
+def update_group_tables(deltas):
+    rebuilds = {}
+    for (friend_id, stage_id), team_deltas in deltas.items():
+        if not apply_group_table_deltas(friend_id, stage_id, team_deltas):
+            rebuilds.setdefault(stage_id, []).append(friend_id)
+    for stage_id, friend_ids in rebuilds.items():
+        rebuild_group_tables(stage_id, friend_ids)
+
+
+@receiver(post_init, sender=GroupPrediction)
+def remember_loaded_scores(sender, instance, **kwargs):
+    instance._loaded_scores = (instance.__dict__.get('home_score'), instance.__dict__.get('away_score'))
+
+
+@receiver(post_save, sender=GroupPrediction)
+def update_group_table(sender, instance, created, **kwargs):
+    old_scores = (None, None) if created else instance._loaded_scores
+    new_scores = (instance.home_score, instance.away_score)
+    instance._loaded_scores = new_scores
+    if old_scores == new_scores and not created:
+        return
+
+    deltas = group_table_deltas(instance.match, old_scores, new_scores)
+    recompute.defer(update_group_tables, (instance.friend_id, instance.match.stage_id), deltas)
 
 
 def group_ranking(group_rows):
@@ -0,0 +1,178 @@
+"""Versioned caching of whole pages, and conditional GET.
+
+Every cached page belongs to a scope: the tournaments list, or one tournament. The version of a
+scope is the time it last changed and is part of the page keys, so bumping it on save/delete
+makes the old pages unreachable and they expire from the cache on their own. Repeat views of an
+unchanged page are then served from the cache without touching the database.
+
+The predictions, results and points of a tournament have a scope of their own, so scoring a match
+doesn't throw away the cached matches and stage pages. Both versions of a tournament drive the
+ETag and Last-Modified headers of its pages, letting browsers revalidate with a 304.
+
+With several gunicorn workers the cache backend has to be shared between them (CACHE_URL set to
+a file or Redis cache), otherwise a worker that didn't handle the admin change keeps its pages.
+"""
+import time
+from datetime import UTC, datetime
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.http import HttpResponse
+
+from . import recompute
+from .models import GroupPrediction, Match, PredictionResult, Stage, StagePoint, TopScorerPoint, TotalPoint, \
+    Tournament, matches_scored, matches_updated, predictions_updated, total_points_changed
+
+TOURNAMENTS_SCOPE = "tournaments"
+
+
+def tournament_scope(tournament_id):
+    return f"tournament:{tournament_id}"
+
+
+def results_scope(tournament_id):
+    return f"results:{tournament_id}"
+
+
+def version_key(scope):
+    return f"tournaments:version:{scope}"
+
+
+def get_version(scope):
+    key = version_key(scope)
+    version = cache.get(key)
+    if version is None:
+        version = time.time()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def set_versions(scopes):
+    now = time.time()
+    cache.set_many({version_key(scope): now for scope in scopes}, None)
+
+
+def bump_version(scope):
+    """Move scope to a new version once the current transaction commits.
+
+    Bumps are coalesced per scope, so saving many rows in one transaction writes each version once.
+    Until the commit, readers still see (and may cache) the committed pages under the old version.
+    """
+    recompute.defer(set_versions, scope, atomic=False)
+
+
+def cached_page(scope):
+    """Cache the rendered GET responses of a view under the current version of scope(**kwargs)."""
+    def decorator(view):
+        def page_key(request, kwargs):
+            page_scope = scope(**kwargs)
+            return f"tournaments:page:{page_scope}:{get_version(page_scope)}:{request.get_full_path()}"
+
+        def store(key, response):
+            if response.status_code != 200:
+                return
+
+            def rendered(response):
+                cache.set(key, response.content, settings.PAGE_CACHE_TIMEOUT)
+
+            if getattr(response, "is_rendered", True):
+                rendered(response)
+            else:
+                response.add_post_render_callback(rendered)
+
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                if request.method != "GET":
+                    return await view(request, *args, **kwargs)
+                key = await sync_to_async(page_key)(request, kwargs)
+                content = await cache.aget(key)
+                if content is not None:
+                    return HttpResponse(content)
+                response = await view(request, *args, **kwargs)
+                store(key, response)
+                return response
+        else:
+            @wraps(view)
+            def wrapper(request, *args, **kwargs):
+                if request.method != "GET":
+                    return view(request, *args, **kwargs)
+                key = page_key(request, kwargs)
+                content = cache.get(key)
+                if content is not None:
+                    return HttpResponse(content)
+                response = view(request, *args, **kwargs)
+                store(key, response)
+                return response
+        return wrapper
+    return decorator
+
+
+def tournament_etag(request, tournament_id, **kwargs):
+    return f'"{get_version(tournament_scope(tournament_id))}-{get_version(results_scope(tournament_id))}"'
+
+
+def tournament_last_modified(request, tournament_id, **kwargs):
+    version = max(get_version(tournament_scope(tournament_id)), get_version(results_scope(tournament_id)))
+    return datetime.fromtimestamp(version, UTC)
+
+
+@receiver([post_save, post_delete], sender=Tournament)
+def bump_tournament_version(sender, instance, **kwargs):
+    bump_version(TOURNAMENTS_SCOPE)
+    bump_version(tournament_scope(instance.pk))
+
+
+@receiver([post_save, post_delete], sender=Stage)
+def bump_stage_version(sender, instance, **kwargs):
+    bump_version(tournament_scope(instance.tournament_id))
+
+
+@receiver(pre_save, sender=Match)
+def bump_match_previous_tournament_version(sender, instance, **kwargs):
+    previous = getattr(instance, '_loaded_tournament_id', None)
+    if previous is not None and previous != instance.tournament_id:
+        bump_version(tournament_scope(previous))
+
+
+@receiver([post_save, post_delete], sender=Match)
+def bump_match_version(sender, instance, **kwargs):
+    bump_version(tournament_scope(instance.tournament_id))
+
+
+@receiver(matches_updated)
+def bump_bulk_match_version(sender, tournament_id, **kwargs):
+    bump_version(tournament_scope(tournament_id))
+
+
+@receiver([post_save, post_delete], sender=StagePoint)
+def bump_stage_point_version(sender, instance, **kwargs):
+    bump_version(tournament_scope(instance.stage.tournament_id))
+
+
+@receiver(total_points_changed)
+def bump_results_version_on_total_points_change(sender, tournament_id, **kwargs):
+    bump_version(results_scope(tournament_id))
+
+
+@receiver(matches_scored)
+@receiver(predictions_updated)
+def bump_results_version_on_bulk_change(sender, tournament_id, **kwargs):
+    bump_version(results_scope(tournament_id))
+
+
+@receiver([post_save, post_delete], sender=GroupPrediction)
+@receiver([post_save, post_delete], sender=PredictionResult)
+@receiver([post_save, post_delete], sender=TotalPoint)
+def bump_results_version(sender, instance, **kwargs):
+    bump_version(results_scope(instance.tournament_id))
+
+
+@receiver([post_save, post_delete], sender=TopScorerPoint)
+def bump_top_scorer_point_results_version(sender, instance, **kwargs):
+    bump_version(results_scope(instance.match.tournament_id))
@@ -0,0 +1,57 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+
+PAGE_SIZE = 100
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, length):
+    """The key values encoded in cursor, or None when it's missing or malformed."""
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        return None
+    if not isinstance(values, list) or len(values) != length:
+        return None
+    if not all(isinstance(value, (str, int, float)) for value in values):
+        return None
+    return values
+
+
+def keyset_page(queryset, ordering, cursor=None, page_size=PAGE_SIZE):
+    """Return one page of queryset and the cursor of the next page (None on the last page).
+
+    ordering is a tuple of order_by() style lookups that must end with a unique one, e.g.
+    ('-points', 'prediction__friend'). Instead of an OFFSET, the next page starts after the
+    key of the last row, so every page costs the same no matter how deep the reader goes.
+    """
+    keys = [(f"keyset_{i}", lookup.removeprefix("-"), lookup.startswith("-")) for i, lookup in enumerate(ordering)]
+    queryset = queryset.annotate(**{alias: F(lookup) for alias, lookup, _ in keys}).order_by(
+        *[f"-{alias}" if descending else alias for alias, _, descending in keys]
+    )
+
+    values = decode_cursor(cursor, len(keys))
+    if values is not None:
+        after = Q()
+        for i, (alias, _, descending) in enumerate(keys):
+            ties = {prev_alias: value for (prev_alias, _, _), value in zip(keys[:i], values)}
+            after |= Q(**ties, **{f"{alias}__{'lt' if descending else 'gt'}": values[i]})
+        try:
+            queryset = queryset.filter(after)
+        except (TypeError, ValueError, ValidationError):
+            # A hand-edited cursor whose values don't fit the key's fields reads as no cursor.
+            pass
+
+    rows = list(queryset[:page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    return rows, encode_cursor([getattr(rows[-1], alias) for alias, _, _ in keys])
@@ -0,0 +1,125 @@
+"""Deferred maintenance of derived tables (totals, group tables, prediction results).
+
+Receivers don't recompute derived rows themselves. They defer a handler with a key such as
+(friend_id, tournament_id) and, optionally, an additive delta. Everything deferred inside a
+transaction is coalesced per handler and key and processed once when the transaction commits, so
+saving many rows in one admin change or formset doesn't redo the same work for each row.
+
+Work deferred inside a savepoint that is rolled back is dropped with it: every deferral registers an
+on_commit() callback, which Django forgets on rollback. The first of them to run processes the
+batch, and only the items whose callback is still registered are part of it.
+"""
+import threading
+import weakref
+
+from django.db import transaction
+
+_local = threading.local()
+
+
+def merge_deltas(current, delta):
+    if current is None:
+        return delta
+    if delta is None:
+        return current
+    if isinstance(current, dict):
+        merged = dict(current)
+        for key, value in delta.items():
+            merged[key] = merge_deltas(merged.get(key), value)
+        return merged
+    return current + delta
+
+
+class Deferral:
+    """Stands for one deferral in the transaction's on_commit() callbacks.
+
+    Only those callbacks reference it, so it's garbage once a rollback drops it.
+    """
+
+    def __init__(self, batch):
+        self.batch = batch
+
+    def __call__(self):
+        if not self.batch.done:
+            self.batch.run()
+
+
+class RecomputeBatch:
+    def __init__(self):
+        self.pending = {}
+        self.non_atomic = set()
+        self.done = False
+
+    def add(self, handler, key, delta, deferral, atomic):
+        if not atomic:
+            self.non_atomic.add(handler)
+        items = self.pending.setdefault(handler, {})
+        items.setdefault(key, []).append((weakref.ref(deferral), delta))
+
+    def discard(self, handler, matches):
+        items = self.pending.get(handler, {})
+        for key in [key for key in items if matches(key)]:
+            del items[key]
+
+    @staticmethod
+    def surviving(items):
+        surviving = {}
+        for key, deferrals in items.items():
+            deltas = [delta for deferral, delta in deferrals if deferral() is not None]
+            if deltas:
+                merged = None
+                for delta in deltas:
+                    merged = merge_deltas(merged, delta)
+                surviving[key] = merged
+        return surviving
+
+    def run(self):
+        self.done = True
+        previous, _local.running = getattr(_local, 'running', None), self
+        try:
+            while self.pending:
+                handler = next(iter(self.pending))
+                items = self.surviving(self.pending.pop(handler))
+                if items and handler in self.non_atomic:
+                    handler(items)
+                elif items:
+                    with transaction.atomic():
+                        handler(items)
+        finally:
+            _local.running = previous
+
+
+def defer(handler, key, delta=None, atomic=True):
+    """Call handler({key: delta, ...}) once, when the current transaction commits.
+
+    Deferring the same handler and key again in the same transaction merges the deltas (numbers
+    and nested dicts of numbers are summed). Outside a transaction the handler runs right away.
+    The handler runs in a transaction of its own, unless atomic is False (for handlers that don't
+    write to the database).
+    """
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        handler({key: delta})
+        return
+
+    # The batch is only referenced by its deferrals, so once a rollback dropped all of them it's gone
+    # and the next deferral starts a new one.
+    batch = _local.batch() if hasattr(_local, 'batch') else None
+    if batch is None or batch.done:
+        batch = RecomputeBatch()
+        _local.batch = weakref.ref(batch)
+    deferral = Deferral(batch)
+    transaction.on_commit(deferral)
+    batch.add(handler, key, delta, deferral, atomic)
+
+
+def discard(handler, matches):
+    """Drop the deferred work of handler whose key matches, because it was just recomputed from scratch.
+
+    Rebuilds read the current rows, which already include every change whose delta is still
+    waiting, so applying those deltas afterwards would count them twice.
+    """
+    batch = _local.batch() if hasattr(_local, 'batch') else None
+    for batch in (batch, getattr(_local, 'running', None)):
+        if batch is not None:
+            batch.discard(handler, matches)
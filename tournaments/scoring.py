@@ -0,0 +1,36 @@
+"""Score many predictions at once.
+
+Predictions are scored as plain columns, one (match, home_score, away_score) row per prediction,
+against a table of the matches' final scores and point rules, instead of loading model instances
+and looking up each prediction's match and rule one at a time.
+
+A score of None (an empty prediction, or a match without a final score) isn't played.
+"""
+NOT_PARTICIPATED, WRONG, HIT, BULLSEYE = range(4)
+
+
+def sign(n):
+    return (n > 0) - (n < 0)
+
+
+def score_predictions(predictions, matches):
+    """Score every prediction against its match.
+
+    predictions is a sequence of (match_key, home_score, away_score) and matches maps each
+    match_key to (home_score, away_score, wrong, hit, bullseye), the final score and the points
+    of its stage's MatchPointRule. Return (points, outcomes), two lists parallel to predictions.
+    """
+    points, outcomes = [], []
+    for match_key, home, away in predictions:
+        match_home, match_away, wrong, hit, bullseye = matches[match_key]
+        if None in (home, away, match_home, match_away):
+            outcome, p = NOT_PARTICIPATED, 0
+        elif home == match_home and away == match_away:
+            outcome, p = BULLSEYE, bullseye
+        elif sign(home - away) == sign(match_home - match_away):
+            outcome, p = HIT, hit
+        else:
+            outcome, p = WRONG, wrong
+        points.append(p)
+        outcomes.append(outcome)
+    return points, outcomes
@@ -21,43 +21,60 @@ with the score he predicted.
 
 Friend A saves a prediction to a KO match which saves it with the same teams as a score of his choosing.
 """
+import asyncio
+import json
+import os
+import tempfile
 from datetime import UTC, datetime
+from io import StringIO
+from unittest import mock
 
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.module_loading import import_string
 
-from tournaments.models import GroupPrediction, Match, MatchPointRule, PredictionResult, Stage, Team, Tournament, \
-    create_start_predictions
+from tournaments import leaderboard, live, pagecache, scoring
+from tournaments.models import GroupPrediction, GroupRow, Match, MatchPointRule, PredictionResult, RegisteredTournament, \
+    ScoringJob, Stage, StagePoint, Team, TopScorerPoint, TotalPoint, Tournament, create_start_predictions, \
+    rebuild_total_points
+from tournaments.pagination import encode_cursor, keyset_page
 from tournaments.views import tournaments
 
 
 class PredictionResultTest(TestCase):
     def setUp(self):
-        self.tournament = Tournament.objects.create(name="Euro 2024")
-        self.stage = Stage.objects.create(name="Group A", tournament=self.tournament)
-        self.home_team = Team.objects.create(name="Team A")
-        self.away_team = Team.objects.create(name="Team B")
-        self.match = Match.objects.create(
-            start_time=datetime.now(UTC),
-            stage=self.stage,
-            home_team=self.home_team,
-            away_team=self.away_team,
-            number=1
-        )
-        self.friend = User.objects.create_user(username="idanmel")
-        self.friend2 = User.objects.create_user(username="idanmel2")
-        self.prediction = GroupPrediction.objects.create(
-            friend=self.friend,
-            match=self.match,
-            home_score=1,
-            away_score=1
-        )
-        self.prediction2 = GroupPrediction.objects.create(
-            friend=self.friend2,
-            match=self.match,
-            home_score=2,
-            away_score=2
-        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tournament = Tournament.objects.create(name="Euro 2024")
+            self.stage = Stage.objects.create(name="Group A", tournament=self.tournament)
+            self.home_team = Team.objects.create(name="Team A")
+            self.away_team = Team.objects.create(name="Team B")
+            self.match = Match.objects.create(
+                start_time=datetime.now(UTC),
+                stage=self.stage,
+                home_team=self.home_team,
+                away_team=self.away_team,
+                number=1
+            )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.friend = User.objects.create_user(username="idanmel")
+            self.friend2 = User.objects.create_user(username="idanmel2")
+            self.prediction = GroupPrediction.objects.create(
+                friend=self.friend,
+                match=self.match,
+                home_score=1,
+                away_score=1
+            )
+            self.prediction2 = GroupPrediction.objects.create(
+                friend=self.friend2,
+                match=self.match,
+                home_score=2,
+                away_score=2
+            )
         self.match_point_rule = MatchPointRule.objects.create(
             stage=self.stage,
             wrong=0,
@@ -67,52 +84,732 @@ class PredictionResultTest(TestCase):
 
     def test_create_predictions_results(self):
         self.match.home_score = self.match.away_score = 1
-        self.match.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.match.save()
         pr = PredictionResult.objects.get(prediction=self.prediction)
         self.assertEqual(pr.points, 5)
         pr2 = PredictionResult.objects.get(prediction=self.prediction2)
         self.assertEqual(pr2.points, 3)
 
     def test_update_prediction_result(self):
-        PredictionResult.objects.create(prediction=self.prediction, points=5, result=PredictionResult.Result.BULLSEYE)
-        PredictionResult.objects.create(prediction=self.prediction2, points=3, result=PredictionResult.Result.HIT)
         self.match.home_score = self.match.away_score = 3
-        self.match.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            PredictionResult.objects.create(prediction=self.prediction, points=5,
+                                            result=PredictionResult.Result.BULLSEYE)
+            PredictionResult.objects.create(prediction=self.prediction2, points=3, result=PredictionResult.Result.HIT)
+            self.match.save()
         prs = PredictionResult.objects.all()
         for pr in prs:
             self.assertTrue(pr.hit())
 
     def test_prediction_result_when_match_returns_not_finished(self):
-        PredictionResult.objects.create(prediction=self.prediction, points=5, result=PredictionResult.Result.BULLSEYE)
-        PredictionResult.objects.create(prediction=self.prediction2, points=3, result=PredictionResult.Result.HIT)
         self.match.home_score = self.match.away_score = None
-        self.match.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            PredictionResult.objects.create(prediction=self.prediction, points=5,
+                                            result=PredictionResult.Result.BULLSEYE)
+            PredictionResult.objects.create(prediction=self.prediction2, points=3, result=PredictionResult.Result.HIT)
+            self.match.save()
         prs = PredictionResult.objects.all()
         for pr in prs:
             self.assertTrue(pr.not_participated())
 
+    def test_scoring_updates_total_points(self):
+        self.match.home_score = self.match.away_score = 1
+        with self.captureOnCommitCallbacks(execute=True):
+            self.match.save()
+        self.assertEqual(TotalPoint.objects.get(friend=self.friend, tournament=self.tournament).points, 5)
+        self.assertEqual(TotalPoint.objects.get(friend=self.friend2, tournament=self.tournament).points, 3)
 
-class GroupTableTest(TestCase):
+    def test_scoring_stores_match_statistics(self):
+        self.match.home_score = self.match.away_score = 1
+        with self.captureOnCommitCallbacks(execute=True):
+            self.match.save()
+        m = Match.objects.get(pk=self.match.pk)
+        self.assertEqual((m.bullseye_count, m.hit_count, m.wrong_count, m.not_participated_count), (1, 1, 0, 0))
+        self.assertEqual(m.points_sum, 8)
+        response = self.client.get(f"/tournaments/{self.tournament.pk}/matches/{self.match.pk}")
+        self.assertEqual(response.context["statistics"]["bullseye"], "50%")
+        self.assertEqual(response.context["statistics"]["points_avg"], "4")
+
+    def test_deleting_predictions_refreshes_match_statistics(self):
+        self.match.home_score = self.match.away_score = 1
+        with self.captureOnCommitCallbacks(execute=True):
+            self.match.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.prediction2.delete()
+        m = Match.objects.get(pk=self.match.pk)
+        self.assertEqual((m.bullseye_count, m.hit_count, m.points_sum), (1, 0, 5))
+        response = self.client.get(f"/tournaments/{self.tournament.pk}/matches/{self.match.pk}")
+        self.assertEqual(response.context["statistics"]["bullseye"], "100%")
+        self.assertEqual(response.context["statistics"]["points_avg"], "5")
+
+    def test_editing_a_prediction_result_updates_match_statistics(self):
+        self.match.home_score = self.match.away_score = 1
+        with self.captureOnCommitCallbacks(execute=True):
+            self.match.save()
+        pr = PredictionResult.objects.get(prediction=self.prediction)
+        pr.points, pr.result = 10, PredictionResult.Result.HIT
+        with self.captureOnCommitCallbacks(execute=True):
+            pr.save()
+        m = Match.objects.get(pk=self.match.pk)
+        self.assertEqual((m.bullseye_count, m.hit_count, m.points_sum), (0, 2, 13))
+        self.assertEqual(TotalPoint.objects.get(friend=self.friend, tournament=self.tournament).points, 10)
+
+    def test_deleted_prediction_results_stay_deleted(self):
+        self.match.home_score = self.match.away_score = 1
+        with self.captureOnCommitCallbacks(execute=True):
+            self.match.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            PredictionResult.objects.get(prediction=self.prediction2).delete()
+        self.assertFalse(PredictionResult.objects.filter(prediction=self.prediction2).exists())
+        m = Match.objects.get(pk=self.match.pk)
+        self.assertEqual((m.bullseye_count, m.hit_count, m.points_sum), (1, 0, 5))
+
+    def test_repointed_prediction_follows_its_match(self):
+        self.match.home_score = self.match.away_score = 1
+        with self.captureOnCommitCallbacks(execute=True):
+            self.match.save()
+        other = Tournament.objects.create(name="World Cup 2026")
+        with self.captureOnCommitCallbacks(execute=True):
+            other_match = Match.objects.create(start_time=datetime.now(UTC), number=1,
+                                               stage=Stage.objects.create(name="Group A", tournament=other))
+            prediction = GroupPrediction.objects.get(pk=self.prediction.pk)
+            prediction.match = other_match
+            prediction.save()
+        self.assertEqual(GroupPrediction.objects.get(pk=self.prediction.pk).tournament, other)
+        self.assertEqual(PredictionResult.objects.get(prediction=self.prediction).tournament, other)
+
+        result = PredictionResult.objects.get(prediction=self.prediction2)
+        result.prediction = prediction
+        PredictionResult.objects.filter(prediction=prediction).delete()
+        result.save()
+        self.assertEqual(PredictionResult.objects.get(pk=result.pk).tournament, other)
+        stats = Match.objects.filter(pk__in=[self.match.pk, other_match.pk]).order_by('pk').values_list(
+            'bullseye_count', 'hit_count', 'points_sum')
+        self.assertEqual(list(stats), [(0, 0, 0), (0, 1, 3)])
+
+    def test_match_predictions_keyset_pages(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(3):
+                friend = User.objects.create_user(username=f"friend{i}", first_name=f"{3 - i}")
+                GroupPrediction.objects.create(friend=friend, match=self.match, home_score=i, away_score=i)
+        self.match.home_score = self.match.away_score = 1
+        with self.captureOnCommitCallbacks(execute=True):
+            self.match.save()
+
+        results = PredictionResult.objects.filter(prediction__match=self.match)
+        for ordering, key in [
+            (('-points', 'prediction__friend'), lambda pr: (-pr.points, pr.prediction.friend_id)),
+            (('prediction__friend__first_name', 'prediction__friend'),
+             lambda pr: (pr.prediction.friend.first_name, pr.prediction.friend_id)),
+        ]:
+            seen, cursor = [], None
+            while True:
+                page, cursor = keyset_page(results.select_related('prediction__friend'), ordering, cursor, 2)
+                seen += page
+                if cursor is None:
+                    break
+            self.assertEqual(seen, sorted(results.select_related('prediction__friend'), key=key))
+
+        response = self.client.get(f"/tournaments/{self.tournament.pk}/matches/{self.match.pk}?order=friend")
+        self.assertEqual(response.context["order"], "friend")
+        self.assertIsNone(response.context["next_cursor"])
+        self.assertEqual(len(response.context["predictions"]), 5)
+
+        for cursor in ["WyJhIiwgMl0", encode_cursor([[1], 2]), encode_cursor([None, 2])]:
+            response = self.client.get(f"/tournaments/{self.tournament.pk}/matches/{self.match.pk}?after={cursor}")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.context["predictions"]), 5)
+
+    def test_scoring_query_count_does_not_grow_with_predictions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(10):
+                friend = User.objects.create_user(username=f"friend{i}")
+                GroupPrediction.objects.create(friend=friend, match=self.match, home_score=i, away_score=0)
+        self.match.home_score = self.match.away_score = 1
+        with self.assertNumQueries(17), self.captureOnCommitCallbacks(execute=True):
+            self.match.save()
+        self.assertEqual(PredictionResult.objects.count(), 12)
+
+    @override_settings(ASYNC_SCORING=True)
+    def test_async_scoring_is_done_by_the_worker(self):
+        self.match.home_score = self.match.away_score = 1
+        with self.captureOnCommitCallbacks(execute=True):
+            self.match.save()
+        self.assertFalse(PredictionResult.objects.exists())
+        self.assertEqual(ScoringJob.objects.get().status, ScoringJob.Status.PENDING)
+
+        call_command("scoring_worker", "--once", stdout=StringIO())
+        self.assertEqual(ScoringJob.objects.get().status, ScoringJob.Status.DONE)
+        self.assertEqual(PredictionResult.objects.get(prediction=self.prediction).points, 5)
+
+    @override_settings(ASYNC_SCORING=True)
+    def test_worker_reclaims_abandoned_jobs(self):
+        self.match.home_score = self.match.away_score = 1
+        with self.captureOnCommitCallbacks(execute=True):
+            self.match.save()
+        ScoringJob.objects.update(status=ScoringJob.Status.RUNNING, started_at=datetime.now(UTC))
+        call_command("scoring_worker", "--once", stdout=StringIO())
+        self.assertEqual(ScoringJob.objects.get().status, ScoringJob.Status.RUNNING)
+
+        err = StringIO()
+        call_command("scoring_worker", "--once", "--stale-after=0", stdout=StringIO(), stderr=err)
+        self.assertIn("Reclaimed abandoned jobs", err.getvalue())
+        self.assertEqual(ScoringJob.objects.get().status, ScoringJob.Status.DONE)
+        self.assertEqual(PredictionResult.objects.get(prediction=self.prediction).points, 5)
+
+
+class ScoringTest(TestCase):
+    def test_scoring_matches_the_rules(self):
+        # match key: (home_score, away_score, wrong, hit, bullseye)
+        matches = {"1-0": (1, 0, 0, 3, 5), "1-1": (1, 1, 0, 3, 5), "0-2": (0, 2, 1, 4, 6),
+                   "unplayed": (None, None, 0, 3, 5)}
+        cases = [
+            (("1-0", 1, 0), (5, scoring.BULLSEYE)),
+            (("1-0", 2, 0), (3, scoring.HIT)),
+            (("1-0", 0, 0), (0, scoring.WRONG)),
+            (("1-0", 0, 1), (0, scoring.WRONG)),
+            (("1-0", None, 0), (0, scoring.NOT_PARTICIPATED)),
+            (("1-1", 1, 1), (5, scoring.BULLSEYE)),
+            (("1-1", 2, 2), (3, scoring.HIT)),
+            (("1-1", 1, 0), (0, scoring.WRONG)),
+            (("0-2", 0, 2), (6, scoring.BULLSEYE)),
+            (("0-2", 1, 3), (4, scoring.HIT)),
+            (("0-2", 2, 0), (1, scoring.WRONG)),
+            (("0-2", 1, None), (0, scoring.NOT_PARTICIPATED)),
+            (("unplayed", 1, 1), (0, scoring.NOT_PARTICIPATED)),
+        ]
+        points, outcomes = scoring.score_predictions([prediction for prediction, _ in cases], matches)
+        self.assertEqual(list(zip(points, outcomes)), [expected for _, expected in cases])
+
+
+class TotalPointTest(TestCase):
     def setUp(self):
-        self.friend = User.objects.create(username="idanmel")
         self.tournament = Tournament.objects.create(name="Euro 2024")
         self.stage = Stage.objects.create(name="Group A", tournament=self.tournament)
-        self.germany = Team.objects.create(name="Germany")
-        self.scotland = Team.objects.create(name="Scotland")
-        self.match = Match.objects.create(
+        self.friend = User.objects.create_user(username="idanmel")
+
+    def total_points(self):
+        return TotalPoint.objects.get(friend=self.friend, tournament=self.tournament).points
+
+    def test_stage_point_changes_apply_a_delta(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            stage_point = StagePoint.objects.create(friend=self.friend, stage=self.stage, points=4)
+        self.assertEqual(self.total_points(), 4)
+        stage_point.points = 6
+        with self.captureOnCommitCallbacks(execute=True):
+            stage_point.save()
+        self.assertEqual(self.total_points(), 6)
+        with self.captureOnCommitCallbacks(execute=True):
+            stage_point.delete()
+        self.assertEqual(self.total_points(), 0)
+
+    def test_changes_in_one_transaction_are_applied_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            StagePoint.objects.create(friend=self.friend, stage=self.stage, points=1)
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            for points in range(2, 6):
+                StagePoint.objects.update_or_create(friend=self.friend, stage=self.stage, defaults={"points": points})
+        total_point_updates = [q for q in queries.captured_queries if q["sql"].startswith('UPDATE "tournaments_totalpoint"')]
+        self.assertEqual(len(total_point_updates), 1)
+        self.assertEqual(self.total_points(), 5)
+
+    def test_changes_rolled_back_to_a_savepoint_are_dropped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            stage_point = StagePoint.objects.create(friend=self.friend, stage=self.stage, points=1)
+        other_stage = Stage.objects.create(name="Group B", tournament=self.tournament)
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            stage_point.points = 2
+            stage_point.save()
+            try:
+                with transaction.atomic():
+                    StagePoint.objects.create(friend=self.friend, stage=other_stage, points=10)
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+        self.assertEqual(self.total_points(), 2)
+
+    def test_deleting_a_scored_tournament(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            StagePoint.objects.create(friend=self.friend, stage=self.stage, points=4)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tournament.delete()
+        self.assertFalse(TotalPoint.objects.exists())
+
+    def test_loading_points_deferred_doesnt_query_them(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            StagePoint.objects.create(friend=self.friend, stage=self.stage, points=4)
+        with self.assertNumQueries(1):
+            stage_point, = StagePoint.objects.only('pk')
+        stage_point.points = 7
+        with self.captureOnCommitCallbacks(execute=True):
+            stage_point.save()
+        self.assertEqual(self.total_points(), 7)
+
+    def test_rebuild_command_fixes_drift(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            StagePoint.objects.create(friend=self.friend, stage=self.stage, points=4)
+        TotalPoint.objects.filter(friend=self.friend).update(points=10)
+        out = StringIO()
+        call_command("rebuild_total_points", stdout=out)
+        self.assertIn("10 -> 4", out.getvalue())
+        self.assertEqual(self.total_points(), 4)
+
+
+class StandingsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tournament = Tournament.objects.create(name="Euro 2024")
+        self.stage = Stage.objects.create(name="Group A", tournament=self.tournament)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.stage_points = [
+                StagePoint.objects.create(friend=User.objects.create_user(username=f"friend{i}"), stage=self.stage,
+                                          points=points)
+                for i, points in enumerate([5, 3, 5])
+            ]
+
+    def test_equal_points_share_a_rank(self):
+        ranked = leaderboard.standings(self.tournament.pk)
+        self.assertEqual([(row["points"], row["rank"]) for row in ranked], [(5, 1), (5, 1), (3, 3)])
+
+    def test_standings_are_cached_until_total_points_change(self):
+        leaderboard.standings(self.tournament.pk)
+        with self.assertNumQueries(0):
+            leaderboard.standings(self.tournament.pk)
+        self.stage_points[1].points = 7
+        with self.captureOnCommitCallbacks(execute=True):
+            self.stage_points[1].save()
+        ranked = leaderboard.standings(self.tournament.pk)
+        self.assertEqual([(row["points"], row["rank"]) for row in ranked], [(7, 1), (5, 2), (5, 2)])
+
+
+class ConstantQueriesMixin:
+    def assertConstantQueries(self, url, add_rows):
+        """Fail if the page at url runs more queries after add_rows() adds rows to it."""
+        cache.clear()
+        with CaptureQueriesContext(connection) as before:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            add_rows()
+        cache.clear()
+        with CaptureQueriesContext(connection) as after:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(len(before), len(after), [q["sql"] for q in after.captured_queries])
+
+
+class ViewQueryCountTest(ConstantQueriesMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tournament = Tournament.objects.create(name="Euro 2024")
+        self.stage = Stage.objects.create(name="Group A", tournament=self.tournament)
+        self.friend = User.objects.create_user(username="idanmel")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.match = self.add_match()
+
+    def add_match(self):
+        number = Match.objects.count() + 1
+        match = Match.objects.create(
             start_time=datetime.now(UTC),
             stage=self.stage,
-            home_team=self.germany,
-            away_team=self.scotland,
-            number=1
+            home_team=Team.objects.create(name=f"Home {number}"),
+            away_team=Team.objects.create(name=f"Away {number}"),
+            number=number
         )
-        # self.gp = GroupPrediction.objects.create(
-        #     friend=self.friend,
-        #     match=self.match,
-        #     home_score=5,
-        #     away_score=1,
-        # )
+        self.add_scored_prediction(self.friend, match)
+        TopScorerPoint.objects.create(friend=self.friend, match=match, points=2)
+        return match
+
+    def add_scored_prediction(self, friend, match):
+        prediction = GroupPrediction.objects.create(friend=friend, match=match, home_score=1, away_score=0)
+        PredictionResult.objects.create(prediction=prediction, points=3, result=PredictionResult.Result.HIT)
+
+    def add_friends(self):
+        for i in range(3):
+            friend = User.objects.create_user(username=f"friend{i}")
+            self.add_scored_prediction(friend, self.match)
+            StagePoint.objects.create(friend=friend, stage=self.stage, points=i)
+
+    def add_matches(self):
+        for _ in range(3):
+            self.add_match()
+
+    def test_match(self):
+        self.assertConstantQueries(f"/tournaments/{self.tournament.pk}/matches/{self.match.pk}", self.add_friends)
+
+    def test_matches(self):
+        self.assertConstantQueries(f"/tournaments/{self.tournament.pk}/matches", self.add_matches)
+
+    def test_standings(self):
+        self.assertConstantQueries(f"/tournaments/{self.tournament.pk}/standings", self.add_friends)
+
+    def test_stage(self):
+        url = f"/tournaments/{self.tournament.pk}/stages/{self.stage.pk}"
+        self.assertConstantQueries(url, self.add_friends)
+        self.assertConstantQueries(url, self.add_matches)
+
+    def test_friend(self):
+        self.assertConstantQueries(f"/tournaments/{self.tournament.pk}/friend/{self.friend.pk}", self.add_matches)
+
+    def test_pages_are_cached_until_the_tournament_changes(self):
+        for url in ["/tournaments/", f"/tournaments/{self.tournament.pk}/matches",
+                    f"/tournaments/{self.tournament.pk}/stages/{self.stage.pk}"]:
+            first = self.client.get(url)
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(url).content, first.content)
+
+        self.match.home_score = self.match.away_score = 2
+        with self.captureOnCommitCallbacks(execute=True):
+            self.match.save()
+        self.assertContains(self.client.get(f"/tournaments/{self.tournament.pk}/matches"), "2 - 2")
+        with self.captureOnCommitCallbacks(execute=True):
+            Tournament.objects.create(name="World Cup 2026")
+        self.assertContains(self.client.get("/tournaments/"), "World Cup 2026")
+
+    def test_version_bumps_are_coalesced_per_transaction(self):
+        with mock.patch.object(pagecache, "set_versions", wraps=pagecache.set_versions) as set_versions, \
+                self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            for match in Match.objects.filter(tournament=self.tournament):
+                match.start_time = datetime.now(UTC)
+                match.save()
+            for _ in range(3):
+                self.add_match()
+        # Once for the saved rows, and once for the totals, which are updated after they commit.
+        self.assertEqual([set(c.args[0]) for c in set_versions.call_args_list], [
+            {pagecache.tournament_scope(self.tournament.pk), pagecache.results_scope(self.tournament.pk)},
+            {pagecache.results_scope(self.tournament.pk)},
+        ])
+
+    async def test_pages_render_under_asgi(self):
+        for url in ["/tournaments/", f"/tournaments/{self.tournament.pk}/standings",
+                    f"/tournaments/{self.tournament.pk}/matches/{self.match.pk}",
+                    f"/tournaments/{self.tournament.pk}/stages/{self.stage.pk}",
+                    f"/tournaments/{self.tournament.pk}/friend/{self.friend.pk}"]:
+            response = await self.async_client.get(url)
+            self.assertContains(response, "Euro 2024")
+
+    def test_unchanged_pages_return_not_modified(self):
+        urls = [f"/tournaments/{self.tournament.pk}/standings", f"/tournaments/{self.tournament.pk}/matches",
+                f"/tournaments/{self.tournament.pk}/matches/{self.match.pk}",
+                f"/tournaments/{self.tournament.pk}/stages/{self.stage.pk}",
+                f"/tournaments/{self.tournament.pk}/friend/{self.friend.pk}"]
+        etags = {url: self.client.get(url)["ETag"] for url in urls}
+        for url in urls:
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(url, headers={"If-None-Match": etags[url]}).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_scored_prediction(User.objects.create_user(username="late"), self.match)
+        for url in urls:
+            self.assertEqual(self.client.get(url, headers={"If-None-Match": etags[url]}).status_code, 200)
+
+
+class QueryMetricsMiddlewareTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_logs_queries_per_view(self):
+        tournament = Tournament.objects.create(name="Euro 2024")
+        with self.assertLogs("tournaments.metrics", level="INFO") as logs:
+            self.client.get(f"/tournaments/{tournament.pk}/matches")
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record["view"], "tournaments:matches")
+        self.assertEqual(record["queries"], 2)
+        self.assertEqual(record["duplicate_queries"], 0)
+
+    async def test_logs_queries_of_async_requests(self):
+        tournament = await Tournament.objects.acreate(name="Euro 2024")
+        with self.assertLogs("tournaments.metrics", level="INFO") as logs:
+            await self.async_client.get(f"/tournaments/{tournament.pk}/matches")
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record["view"], "tournaments:matches")
+        self.assertEqual(record["queries"], 2)
+
+    def test_middleware_chain_stays_async(self):
+        # A single sync-only middleware would make Django run every async view in a thread.
+        for path in settings.MIDDLEWARE:
+            self.assertTrue(getattr(import_string(path), "async_capable", False), path)
+
+
+class ApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tournament = Tournament.objects.create(name="Euro 2024")
+        self.stage = Stage.objects.create(name="Group A", tournament=self.tournament)
+        MatchPointRule.objects.create(stage=self.stage, wrong=0, hit=3, bullseye=5)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.match = Match.objects.create(start_time=datetime.now(UTC), stage=self.stage, number=1,
+                                              home_team=Team.objects.create(name="Team A"),
+                                              away_team=Team.objects.create(name="Team B"))
+        with self.captureOnCommitCallbacks(execute=True):
+            for i, score in enumerate([2, 1]):
+                GroupPrediction.objects.create(friend=User.objects.create_user(username=f"friend{i}", first_name="F"),
+                                               match=self.match, home_score=score, away_score=0)
+        self.match.home_score, self.match.away_score = 2, 0
+        with self.captureOnCommitCallbacks(execute=True):
+            self.match.save()
+
+    async def test_match_predictions_are_flat_and_projected(self):
+        url = f"/tournaments/api/{self.tournament.pk}/matches/{self.match.pk}/predictions"
+        response = await self.async_client.get(url, {"fields": "points,result"})
+        self.assertTrue(response.streaming)
+        self.assertTrue(response.is_async)
+        self.assertEqual(json.loads(b"".join([chunk async for chunk in response.streaming_content])),
+                         [{"points": 5, "result": "BU"}, {"points": 3, "result": "HI"}])
+
+    def test_matches_and_standings(self):
+        matches = self.client.get(f"/tournaments/api/{self.tournament.pk}/matches").json()
+        self.assertEqual(matches[0]["home_team"], "Team A")
+        self.assertEqual(matches[0]["stage_id"], self.stage.pk)
+        standings = self.client.get(f"/tournaments/api/{self.tournament.pk}/standings", {"fields": "points,rank"})
+        self.assertEqual(standings.json(), [{"points": 5, "rank": 1}, {"points": 3, "rank": 2}])
+
+    def test_live_feed_is_only_served_under_asgi(self):
+        url = f"/tournaments/{self.tournament.pk}/live"
+        self.assertEqual(self.client.get(url).status_code, 501)
+        response = asyncio.run(self.async_client.get(url))
+        self.assertTrue(response.is_async)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+
+    def test_live_feed_pushes_scoring_diffs(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        queue = live.broadcaster.subscribe(self.tournament.pk, loop)
+        self.addCleanup(live.broadcaster.unsubscribe, self.tournament.pk, queue)
+        live.broadcaster.snapshot(self.tournament.pk)
+
+        self.match.home_score = 1
+        with self.captureOnCommitCallbacks(execute=True):
+            self.match.save()
+        loop.run_until_complete(asyncio.sleep(0))
+        messages = [queue.get_nowait() for _ in range(queue.qsize())]
+        events = {m.split("\n")[0]: json.loads(m.split("\n")[1].removeprefix("data: ")) for m in messages}
+
+        self.assertEqual(events["event: match"]["bullseye_count"], 1)
+        self.assertEqual([(row["points"], row["rank"]) for row in events["event: standings"]["rows"]],
+                         [(5, 1), (3, 2)])
+        self.assertFalse(events["event: standings"]["full"])
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get(f"/tournaments/api/{self.tournament.pk}/matches", {"fields": "number,stage"})
+        self.assertEqual(response.status_code, 400)
+
+
+class SeedTournamentTest(TestCase):
+    def test_seeds_a_euro_shaped_tournament(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("seed_tournament", friends=3, finished=2, seed=1, stdout=StringIO())
+        t = Tournament.objects.get(name="Benchmark Euro")
+        self.assertEqual(Match.objects.filter(tournament=t).count(), 51)
+        self.assertEqual(Match.objects.filter(tournament=t, home_team__isnull=False).count(), 36)
+        self.assertEqual(Stage.objects.filter(tournament=t, name__startswith="Group").count(), 6)
+        self.assertEqual(GroupPrediction.objects.filter(tournament=t).count(), 3 * 51)
+        self.assertEqual(PredictionResult.objects.filter(tournament=t).count(), 3 * 2)
+        self.assertEqual(TotalPoint.objects.filter(tournament=t).count(), 3)
+        self.assertEqual(GroupRow.objects.filter(stage__tournament=t).count(), 3 * 24)
+
+    def test_reseeding_a_deleted_tournament_reuses_its_teams(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("seed_tournament", friends=1, finished=0, stdout=StringIO())
+        with self.captureOnCommitCallbacks(execute=True):
+            Tournament.objects.get(name="Benchmark Euro").delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("seed_tournament", friends=1, finished=0, stdout=StringIO())
+        t = Tournament.objects.get(name="Benchmark Euro")
+        self.assertEqual(Match.objects.filter(tournament=t, home_team__isnull=False).count(), 36)
+        self.assertEqual(Team.objects.count(), 24)
+
+
+class EnterScoresTest(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("seed_tournament", friends=3, finished=0, seed=1, stdout=StringIO())
+        self.tournament = Tournament.objects.get(name="Benchmark Euro")
+
+    def test_matchday_is_scored_in_one_pass(self):
+        matchday = list(Match.objects.filter(tournament=self.tournament, number=1, home_team__isnull=False)[:4])
+        rows = [{"match_id": m.pk, "home_score": 1, "away_score": 0} for m in matchday[:3]]
+        rows.append({"stage": matchday[3].stage.name, "number": 1, "home_score": 2, "away_score": 2})
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+            json.dump(rows, f)
+        self.addCleanup(os.remove, f.name)
+
+        with mock.patch("tournaments.models.rebuild_total_points", wraps=rebuild_total_points) as rebuild, \
+                self.captureOnCommitCallbacks(execute=True):
+            call_command("enter_scores", f.name, tournament=self.tournament.pk, stdout=StringIO())
+        rebuild.assert_called_once()
+        self.assertEqual(Match.objects.get(pk=matchday[3].pk).home_score, 2)
+        self.assertEqual(PredictionResult.objects.filter(tournament=self.tournament).count(), 3 * 4)
+        self.assertEqual(TotalPoint.objects.filter(tournament=self.tournament).count(), 3)
+
+    def test_negative_scores_are_rejected(self):
+        match = Match.objects.filter(tournament=self.tournament).first()
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as f:
+            f.write(f"match_id,home_score,away_score\n{match.pk},-1,0\n")
+        self.addCleanup(os.remove, f.name)
+        with self.assertRaisesMessage(CommandError, "Row 1: scores can't be negative."):
+            call_command("enter_scores", f.name, stdout=StringIO())
+        self.assertIsNone(Match.objects.get(pk=match.pk).home_score)
+
+    def test_malformed_json_rows_are_rejected(self):
+        match = Match.objects.filter(tournament=self.tournament).first()
+        for rows, message in [
+            ([{"match_id": match.pk, "home_score": None, "away_score": 0}], "Row 1: TypeError"),
+            ([{"match_id": match.pk, "home_score": 1, "away_score": 0}, [match.pk, 1, 0]], "Row 2: expected an object"),
+        ]:
+            with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+                json.dump(rows, f)
+            self.addCleanup(os.remove, f.name)
+            with self.assertRaisesMessage(CommandError, message):
+                call_command("enter_scores", f.name, stdout=StringIO())
+
+
+class RescoreTest(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("seed_tournament", friends=3, finished=12, seed=1, stdout=StringIO())
+        self.tournament = Tournament.objects.get(name="Benchmark Euro")
+
+    def test_rule_change_is_applied_once(self):
+        MatchPointRule.objects.filter(stage__tournament=self.tournament).update(hit=1, bullseye=10)
+        call_command("rescore", tournament=[self.tournament.pk], workers=1, chunk_size=4, stdout=StringIO())
+
+        results = PredictionResult.objects.filter(tournament=self.tournament)
+        self.assertEqual(results.filter(result=PredictionResult.Result.HIT).exclude(points=1).count(), 0)
+        self.assertEqual(results.filter(result=PredictionResult.Result.BULLSEYE).exclude(points=10).count(), 0)
+        for total_point in TotalPoint.objects.filter(tournament=self.tournament):
+            self.assertEqual(total_point.points, sum(results.filter(
+                prediction__friend=total_point.friend).values_list('points', flat=True)))
+
+        out = StringIO()
+        call_command("rescore", tournament=[self.tournament.pk], workers=1, stdout=out)
+        self.assertIn("0 result(s) and 0 total(s) changed", out.getvalue())
+
+    def test_admin_action_leaves_whole_tournaments_to_the_command_or_the_worker(self):
+        self.client.force_login(User.objects.create_superuser(username="admin"))
+        data = {"action": "rescore", "_selected_action": [self.tournament.pk]}
+        # The admin changelist counts its rows twice, which the request metrics log as a warning.
+        with self.assertLogs("tournaments.metrics", level="WARNING"):
+            response = self.client.post("/admin/tournaments/tournament/", data, follow=True)
+        self.assertContains(response, f"manage.py rescore --tournament {self.tournament.pk}")
+        self.assertFalse(ScoringJob.objects.exists())
+
+        with override_settings(ASYNC_SCORING=True), self.assertLogs("tournaments.metrics", level="WARNING"):
+            self.client.post("/admin/tournaments/tournament/", data)
+        self.assertEqual(ScoringJob.objects.filter(match__tournament=self.tournament).count(), 51)
+
+
+class RegistrationTest(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tournament = Tournament.objects.create(name="Euro 2024")
+            self.friend = User.objects.create_user(username="idanmel")
+            for group in "AB":
+                stage = Stage.objects.create(name=f"Group {group}", tournament=self.tournament)
+                teams = [Team.objects.create(name=f"Team {group}{i}") for i in range(4)]
+                for number, (home_team, away_team) in enumerate(zip(teams, teams[1:] + teams[:1])):
+                    Match.objects.create(start_time=datetime.now(UTC), stage=stage, number=number,
+                                         home_team=home_team, away_team=away_team)
+
+    def test_registering_creates_empty_predictions_and_group_tables(self):
+        with self.assertNumQueries(13):
+            RegisteredTournament.objects.create(friend=self.friend, tournament=self.tournament)
+        self.assertEqual(GroupPrediction.objects.filter(friend=self.friend, home_score=None).count(), 8)
+        self.assertEqual(GroupRow.objects.filter(friend=self.friend, pld=0).count(), 8)
+
+    def test_new_match_creates_predictions_for_registered_friends(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            RegisteredTournament.objects.create(friend=self.friend, tournament=self.tournament)
+            stage = Stage.objects.get(name="Group A")
+            match = Match.objects.create(start_time=datetime.now(UTC), stage=stage, number=9,
+                                         home_team=Team.objects.get(name="Team A0"),
+                                         away_team=Team.objects.get(name="Team A2"))
+        self.assertTrue(GroupPrediction.objects.filter(friend=self.friend, match=match).exists())
+        match.home_score = match.away_score = 0
+        with self.assertNumQueries(5), self.captureOnCommitCallbacks(execute=True):
+            match.save()
+
+
+class TofesTest(ConstantQueriesMixin, TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("seed_tournament", friends=1, finished=0, seed=1, stdout=StringIO())
+        self.stage = Stage.objects.get(tournament__name="Benchmark Euro", name="Group A")
+        self.friend = RegisteredTournament.objects.get(tournament=self.stage.tournament).friend
+        self.url = f"/tournaments/stage/{self.stage.pk}/friend/{self.friend.pk}/predictions/"
+
+    def add_matches(self):
+        for number in (7, 8):
+            Match.objects.create(start_time=datetime.now(UTC), stage=self.stage, number=number,
+                                 home_team=Team.objects.create(name=f"Home {number}"),
+                                 away_team=Team.objects.create(name=f"Away {number}"))
+
+    def post_data(self, changes):
+        predictions = GroupPrediction.objects.filter(match__stage=self.stage, friend=self.friend).order_by(
+            'match__stage', 'match__start_time')
+        data = {"form-TOTAL_FORMS": len(predictions), "form-INITIAL_FORMS": len(predictions)}
+        for i, prediction in enumerate(predictions):
+            home_score, away_score = changes.get(i, (prediction.home_score, prediction.away_score))
+            data.update({f"form-{i}-id": prediction.pk, f"form-{i}-home_score": home_score,
+                         f"form-{i}-away_score": away_score})
+        return data, predictions
+
+    def test_get_runs_constant_queries(self):
+        self.assertConstantQueries(self.url, self.add_matches)
+
+    def test_post_writes_only_the_changed_predictions(self):
+        data, predictions = self.post_data({0: (9, 0)})
+        with CaptureQueriesContext(connection) as one_change, self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url, data)
+        updates = [q["sql"] for q in one_change.captured_queries
+                   if q["sql"].startswith('UPDATE "tournaments_groupprediction"')]
+        self.assertEqual(len(updates), 1)
+        home_team = predictions[0].match.home_team
+        self.assertEqual(GroupRow.objects.get(friend=self.friend, stage=self.stage, team=home_team).gf,
+                         9 + sum(p.home_score for p in predictions[1:] if p.match.home_team == home_team)
+                         + sum(p.away_score for p in predictions[1:] if p.match.away_team == home_team))
+
+        data, _ = self.post_data({i: (i, 1) for i in range(6)})
+        with CaptureQueriesContext(connection) as all_changed, self.captureOnCommitCallbacks(execute=True):
+            self.client.post(self.url, data)
+        self.assertEqual(len(one_change), len(all_changed))
+
+
+class GroupTableTest(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.friend = User.objects.create(username="idanmel")
+            self.tournament = Tournament.objects.create(name="Euro 2024")
+            self.stage = Stage.objects.create(name="Group A", tournament=self.tournament)
+            self.germany = Team.objects.create(name="Germany")
+            self.scotland = Team.objects.create(name="Scotland")
+            self.match = Match.objects.create(
+                start_time=datetime.now(UTC),
+                stage=self.stage,
+                home_team=self.germany,
+                away_team=self.scotland,
+                number=1
+            )
+            # self.gp = GroupPrediction.objects.create(
+            #     friend=self.friend,
+            #     match=self.match,
+            #     home_score=5,
+            #     away_score=1,
+            # )
 
     def test_one_win(self):
         self.assertTrue(False)
 
+    def test_changing_a_prediction_updates_the_group_table(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            gp = GroupPrediction.objects.create(friend=self.friend, match=self.match, home_score=5, away_score=1)
+        germany = GroupRow.objects.get(friend=self.friend, team=self.germany)
+        self.assertEqual((germany.position, germany.wins, germany.gf, germany.ga), (1, 1, 5, 1))
+
+        gp.home_score, gp.away_score = 0, 2
+        with self.assertNumQueries(5), self.captureOnCommitCallbacks(execute=True):
+            gp.save()
+        germany = GroupRow.objects.get(friend=self.friend, team=self.germany)
+        scotland = GroupRow.objects.get(friend=self.friend, team=self.scotland)
+        self.assertEqual((germany.position, germany.pld, germany.wins, germany.losses, germany.gf), (2, 1, 0, 1, 0))
+        self.assertEqual((scotland.position, scotland.wins, scotland.gf, scotland.ga), (1, 1, 2, 0))
+
@@ -1,57 +1,102 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
 from django.contrib.auth.models import User
 from django.contrib import messages
+from django.core.handlers.asgi import ASGIRequest
 from django.forms import modelformset_factory
-from django.http import HttpResponse
-from django.shortcuts import render, redirect
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
 from django.urls import reverse_lazy
+from django.views.decorators.http import condition
 from django.views import View
 
-from .forms import PredictionForm
+from . import leaderboard, live
+from .pagecache import TOURNAMENTS_SCOPE, cached_page, tournament_etag, tournament_last_modified, tournament_scope
+from .pagination import keyset_page
+from .forms import BasePredictionFormSet, PredictionForm
 from .models import GroupRow, Match, GroupPrediction, PredictionResult, Stage, StagePoint, TopScorerPoint, TotalPoint, \
-    Tournament
+    Tournament, save_stage_predictions
 
 
-def match(request, tournament_id, match_id):
-    t = Tournament.objects.get(pk=tournament_id)
-    m = Match.objects.get(pk=match_id)
-    predictions_results = PredictionResult.objects.filter(prediction__match=m)
-    context = match_predictions_context(t, m, predictions_results)
-    return render(request, "tournaments/match_predictions.html", context)
+async def alist(queryset):
+    return [obj async for obj in queryset]
 
 
-def matches(request, tournament_id):
-    t = Tournament.objects.get(id=tournament_id)
-    matches = Match.objects.filter(stage__tournament=t)
-    return render(request, "tournaments/matches_page.html", matches_context(t, matches))
+MATCH_PREDICTIONS_ORDERINGS = {
+    "points": ('-points', 'prediction__friend'),
+    "friend": ('prediction__friend__first_name', 'prediction__friend__last_name', 'prediction__friend'),
+}
 
 
-def tournaments(request):
-    ts = Tournament.objects.all()
-    context = {"tournaments": [t.serialize() for t in ts if t]}
-    return render(request, "tournaments/index.html", context)
+@condition(etag_func=tournament_etag, last_modified_func=tournament_last_modified)
+async def match(request, tournament_id, match_id):
+    order = request.GET.get("order")
+    if order not in MATCH_PREDICTIONS_ORDERINGS:
+        order = "points"
+    t, m, (predictions_results, next_cursor) = await asyncio.gather(
+        Tournament.objects.aget(pk=tournament_id),
+        Match.objects.for_serialize().aget(pk=match_id),
+        sync_to_async(keyset_page)(
+            PredictionResult.objects.filter(prediction__match=match_id).for_serialize(),
+            MATCH_PREDICTIONS_ORDERINGS[order],
+            request.GET.get("after")
+        )
+    )
+    context = match_predictions_context(t, m, predictions_results)
+    context.update({"order": order, "next_cursor": next_cursor})
+    return TemplateResponse(request, "tournaments/match_predictions.html", context)
 
 
-def standings_context(t, total_points):
-    points = [tp.points for tp in total_points if tp]
-    ranks = [points.index(value) + 1 for value in points]
-    total_points = [tp.serialize() for tp in total_points if tp]
+@condition(etag_func=tournament_etag, last_modified_func=tournament_last_modified)
+@cached_page(tournament_scope)
+async def matches(request, tournament_id):
+    t, matches = await asyncio.gather(
+        Tournament.objects.aget(id=tournament_id),
+        alist(Match.objects.filter(tournament=tournament_id).for_serialize())
+    )
+    return TemplateResponse(request, "tournaments/matches_page.html", matches_context(t, matches))
+
+
+@cached_page(lambda: TOURNAMENTS_SCOPE)
+async def tournaments(request):
+    ts = await alist(Tournament.objects.all())
+    context = {"tournaments": [t.serialize() for t in ts if t]}
+    return TemplateResponse(request, "tournaments/index.html", context)
 
-    for rank, total_point in zip(ranks, total_points):
-        total_point["rank"] = rank
 
+def standings_context(t, ranked_total_points):
     return {
         "tournament": t.serialize(),
-        "total_points": total_points
+        "total_points": ranked_total_points
     }
 
 
-def standing(request, tournament_id):
-    t = Tournament.objects.get(id=tournament_id)
-    total_points = TotalPoint.objects.filter(tournament=t)
-    context = {"tournament": t.serialize()}
-    if total_points:
-        context = standings_context(t, total_points)
-    return render(request, "tournaments/standings.html", context)
+@condition(etag_func=tournament_etag, last_modified_func=tournament_last_modified)
+async def standing(request, tournament_id):
+    t, ranked_total_points = await asyncio.gather(
+        Tournament.objects.aget(id=tournament_id),
+        sync_to_async(leaderboard.standings)(tournament_id)
+    )
+    context = standings_context(t, ranked_total_points)
+    return TemplateResponse(request, "tournaments/standings.html", context)
+
+
+async def live_feed(request, tournament_id):
+    """Server-sent events with standings and match statistics changes, pushed when scoring completes.
+
+    The stream never ends, and a WSGI server reads an async stream to the end before sending any of
+    it, so the feed is only served under ASGI.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse("The live feed is only served by the ASGI application (backend.asgi).",
+                            status=501, content_type="text/plain")
+    return StreamingHttpResponse(
+        live.event_stream(tournament_id),
+        content_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 def matches_context(tournament, matches):
@@ -65,18 +110,14 @@ def percentize(ratio):
     return f"{ratio * 100:.2f}".rstrip('0').rstrip('.') + "%"
 
 
-def match_prediction_stats(predictions_results):
-    noes = [p for p in predictions_results if p.result == p.Result.NOT_PARTICIPATED]
-    wrongs = [p for p in predictions_results if p.result == p.Result.WRONG]
-    hits = [p for p in predictions_results if p.result == p.Result.HIT]
-    bullseyes = [p for p in predictions_results if p.result == p.Result.BULLSEYE]
-    points = [p.points for p in predictions_results]
+def match_prediction_stats(m):
+    predictions_count = m.predictions_count()
     return {
-        "wrongs": percentize(len(wrongs) / len(predictions_results)),
-        "hit": percentize(len(hits) / len(predictions_results)),
-        "bullseye": percentize(len(bullseyes) / len(predictions_results)),
-        "played": percentize((len(predictions_results) - len(noes)) / len(predictions_results)),
-        "points_avg": f"{sum(points) / len(points):.2f}".rstrip('0').rstrip('.'),
+        "wrongs": percentize(m.wrong_count / predictions_count),
+        "hit": percentize(m.hit_count / predictions_count),
+        "bullseye": percentize(m.bullseye_count / predictions_count),
+        "played": percentize((predictions_count - m.not_participated_count) / predictions_count),
+        "points_avg": f"{m.points_sum / predictions_count:.2f}".rstrip('0').rstrip('.'),
     }
 
 
@@ -86,12 +127,14 @@ def match_predictions_context(t, m, predictions_results):
             "tournament": t.serialize(),
             "match": m.serialize(),
         }
-    return {
+    context = {
         "tournament": t.serialize(),
         "match": m.serialize(),
         "predictions": [p.serialize() for p in predictions_results if p],
-        "statistics": match_prediction_stats(predictions_results),
     }
+    if m.predictions_count():
+        context["statistics"] = match_prediction_stats(m)
+    return context
 
 
 def stage_points_context(t, stage, stage_points, matches):
@@ -103,13 +146,17 @@ def stage_points_context(t, stage, stage_points, matches):
     }
 
 
-def stage_view(request, tournament_id, stage_id):
-    t = Tournament.objects.get(pk=tournament_id)
-    s = Stage.objects.get(pk=stage_id)
-    matches = Match.objects.filter(stage=s)
-    stage_points = StagePoint.objects.filter(stage=s)
+@condition(etag_func=tournament_etag, last_modified_func=tournament_last_modified)
+@cached_page(lambda tournament_id, stage_id: tournament_scope(tournament_id))
+async def stage_view(request, tournament_id, stage_id):
+    t, s, matches, stage_points = await asyncio.gather(
+        Tournament.objects.aget(pk=tournament_id),
+        Stage.objects.aget(pk=stage_id),
+        alist(Match.objects.filter(stage=stage_id).for_serialize()),
+        alist(StagePoint.objects.filter(stage=stage_id).for_serialize())
+    )
     context = stage_points_context(t, s, stage_points, matches)
-    return render(request, "tournaments/stage.html", context)
+    return TemplateResponse(request, "tournaments/stage.html", context)
 
 
 def friend_results_context(t, f, ps, stage_points, top_scorer_points, total_points):
@@ -126,26 +173,35 @@ def friend_results_context(t, f, ps, stage_points, top_scorer_points, total_poin
     }
 
 
-def friend_results(request, tournament_id, friend_id):
-    t = Tournament.objects.get(pk=tournament_id)
-    f = User.objects.get(pk=friend_id)
-    ps = PredictionResult.objects.filter(prediction__match__stage__tournament=t, prediction__friend=f)
-    stage_points = StagePoint.objects.filter(stage__tournament=t, friend=f)
-    top_scorer_points = TopScorerPoint.objects.filter(match__stage__tournament=t, friend=f)
-    total_points = TotalPoint.objects.get(tournament=t, friend=f)
+@condition(etag_func=tournament_etag, last_modified_func=tournament_last_modified)
+async def friend_results(request, tournament_id, friend_id):
+    t, f, ps, stage_points, top_scorer_points, total_points = await asyncio.gather(
+        Tournament.objects.aget(pk=tournament_id),
+        User.objects.aget(pk=friend_id),
+        alist(PredictionResult.objects.filter(tournament=tournament_id, prediction__friend=friend_id).for_serialize()),
+        alist(StagePoint.objects.filter(stage__tournament=tournament_id, friend=friend_id).for_serialize()),
+        alist(TopScorerPoint.objects.filter(match__tournament=tournament_id, friend=friend_id).for_serialize()),
+        TotalPoint.objects.for_serialize().aget(tournament=tournament_id, friend=friend_id)
+    )
     context = friend_results_context(t, f, ps, stage_points, top_scorer_points, total_points)
-    return render(request, "tournaments/friend.html", context)
+    return TemplateResponse(request, "tournaments/friend.html", context)
+
+
+def prediction_formset_class():
+    return modelformset_factory(GroupPrediction, form=PredictionForm, formset=BasePredictionFormSet, extra=0)
 
 
 class FriendPredictions(View):
     def get(self, request, stage_id, friend_id):
-        s = Stage.objects.get(pk=stage_id)
+        s = Stage.objects.select_related('tournament').get(pk=stage_id)
         f = User.objects.get(pk=friend_id)
-        predictions = GroupPrediction.objects.filter(match__stage=s, friend=f).order_by('match__stage', 'match__start_time')
-        group_table = GroupRow.objects.filter(friend=friend_id, stage=stage_id)
+        predictions = GroupPrediction.objects.filter(match__stage=s, friend=f).select_related(
+            'match__stage', 'match__home_team', 'match__away_team'
+        ).order_by('match__stage', 'match__start_time')
+        group_table = GroupRow.objects.filter(friend=friend_id, stage=stage_id).for_serialize()
 
         # Create a formset for the predictions
-        PredictionFormSet = modelformset_factory(GroupPrediction, form=PredictionForm, extra=0)
+        PredictionFormSet = prediction_formset_class()
         formset = PredictionFormSet(queryset=predictions)
         
         context = {
@@ -155,20 +211,21 @@ class FriendPredictions(View):
             "formset": formset,
             "group_table": [group_row.serialize() for group_row in group_table if group_row]
         }
-        return render(request, "tournaments/tofes_2024.html", context)
+        return TemplateResponse(request, "tournaments/tofes_2024.html", context)
     
     def post(self, request, friend_id, stage_id):
-        friend = User.objects.get(pk=friend_id)
-        predictions = GroupPrediction.objects.filter(match__stage=stage_id, friend=friend)
+        predictions = GroupPrediction.objects.filter(match__stage=stage_id, friend=friend_id)
         
         # Create a formset for the predictions
-        prediction_form_set = modelformset_factory(GroupPrediction, form=PredictionForm, extra=0)
+        prediction_form_set = prediction_formset_class()
         formset = prediction_form_set(request.POST, queryset=predictions)
         
         if formset.is_valid():
-            formset.save()
+            # Only the rows the friend edited are written, in one query, and the group table is rebuilt once.
+            changed = [form.save(commit=False) for form in formset.forms if form.has_changed()]
+            save_stage_predictions(stage_id, friend_id, changed)
             messages.success(request, "Your predictions have been saved successfully!")
         else:
             messages.warning(request, "You made an error, shame on you! Your changes were not saved.")
 
-        return redirect('tournaments:predictions', stage_id=stage_id, friend_id=friend_id)
\ No newline at end of file
+        return redirect('tournaments:predictions', stage_id=stage_id, friend_id=friend_id)